@@ -0,0 +1,201 @@
+"""
+Compara planes de consulta y tiempos antes/después de los índices de
+propiedades (migraciones 1, 2 y 9 de migraciones.py) sobre una copia de pisos.db.
+
+Uso (desde Backend/):
+    python -m benchmarks.indices [--factor 50]
+
+--factor replica las filas N veces (con propertyCode distinto) para que
+las diferencias de tiempo sean visibles con la BD de ejemplo.
+
+Las consultas se construyen con las mismas expresiones SQLAlchemy que usan
+los endpoints y la ingesta, y se compilan a SQL de SQLite.
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from sqlalchemy import Integer, and_, cast, func, select, text
+from sqlalchemy.dialects import sqlite
+
+from models import Propiedad
+from services.estadisticas import OPERATION_EXPR, ZONA_EXPR
+from services.planificador import DLAT, DLON, LAT_MAX, LAT_MIN, LON_MAX, LON_MIN
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_ORIGEN = os.path.join(BASE_DIR, "pisos.db")
+
+INDICES = [
+    "ix_propiedades_op_city_district_neigh",
+    "ix_propiedades_op_price",
+    "ix_propiedades_op_lat_lon",
+    "ix_propiedades_huella_digital",
+    "ix_propiedades_op_slugs",
+]
+
+STATS_BUSQUEDA = (
+    func.count(Propiedad.propertyCode),
+    func.min(Propiedad.price),
+    func.max(Propiedad.price),
+    func.min(Propiedad.size),
+    func.max(Propiedad.size),
+    func.min(Propiedad.score_intrinseco),
+    func.max(Propiedad.score_intrinseco),
+)
+
+
+def _sql(consulta):
+    return str(consulta.compile(dialect=sqlite.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+def consultas():
+    """(nombre, select) de las consultas reales de /buscar y de la ingesta."""
+    # Misma expresión que services.planificador.densidad_por_celda
+    celda_lat = cast((Propiedad.latitude - LAT_MIN) / DLAT, Integer)
+    celda_lon = cast((Propiedad.longitude - LON_MIN) / DLON, Integer)
+    return [
+        (
+            "/buscar exacta (slugs)",
+            select(*STATS_BUSQUEDA).where(
+                Propiedad.operation == "rent",
+                Propiedad.city_slug == "madrid",
+                Propiedad.district_slug == "centro",
+            ),
+        ),
+        (
+            "/buscar prefijo (slugs)",
+            select(*STATS_BUSQUEDA).where(
+                Propiedad.operation == "rent",
+                Propiedad.city_slug == "madrid",
+                and_(Propiedad.district_slug >= "cha", Propiedad.district_slug < "cha\uffff"),
+            ),
+        ),
+        (
+            "/buscar parcial (ilike)",
+            select(*STATS_BUSQUEDA).where(
+                Propiedad.operation == "rent",
+                Propiedad.city.ilike("%madrid%"),
+                Propiedad.district.ilike("%centro%"),
+            ),
+        ),
+        (
+            "/buscar + rango de precio",
+            select(*STATS_BUSQUEDA).where(
+                Propiedad.operation == "rent",
+                Propiedad.city_slug == "madrid",
+                Propiedad.price >= 900,
+                Propiedad.price <= 1100,
+            ),
+        ),
+        (
+            "estadisticas (GROUP BY zona)",
+            select(ZONA_EXPR, OPERATION_EXPR, func.count(Propiedad.propertyCode), func.avg(Propiedad.price))
+            .where(ZONA_EXPR.in_(["Centro", "Salamanca"]))
+            .group_by(ZONA_EXPR, OPERATION_EXPR),
+        ),
+        (
+            "planificador (GROUP BY celda)",
+            select(
+                Propiedad.operation, celda_lat, celda_lon, func.count(Propiedad.propertyCode),
+                func.max(Propiedad.fecha_actualizacion), func.max(Propiedad.ultima_ejecucion),
+            )
+            .where(
+                Propiedad.latitude.between(LAT_MIN, LAT_MAX),
+                Propiedad.longitude.between(LON_MIN, LON_MAX),
+            )
+            .group_by(Propiedad.operation, celda_lat, celda_lon),
+        ),
+        (
+            "inactivas (área buscada)",
+            select(Propiedad.propertyCode).where(
+                Propiedad.operation == "sale",
+                Propiedad.latitude.between(40.40, 40.43),
+                Propiedad.longitude.between(-3.72, -3.68),
+            ),
+        ),
+        (
+            "dedup (huellas IN)",
+            select(Propiedad.propertyCode).where(Propiedad.huella_digital.in_(["0" * 32, "f" * 32])),
+        ),
+    ]
+
+
+def replicar(conn, factor):
+    columnas = [r[1] for r in conn.execute("PRAGMA table_info(propiedades)")]
+    resto = ", ".join(f'"{c}"' for c in columnas if c != "propertyCode")
+    for i in range(1, factor):
+        conn.execute(
+            f'INSERT INTO propiedades ("propertyCode", {resto}) '
+            f'SELECT "propertyCode" || \'-r{i}\', {resto} FROM propiedades '
+            f"WHERE \"propertyCode\" NOT LIKE '%-r%'"
+        )
+    conn.commit()
+
+
+def medir(conn, titulo, repeticiones):
+    print(f"\n=== {titulo} ===")
+    for nombre, consulta in consultas():
+        sql = _sql(consulta)
+        plan = " | ".join(r[3] for r in conn.execute(f"EXPLAIN QUERY PLAN {sql}"))
+        t0 = time.perf_counter()
+        for _ in range(repeticiones):
+            conn.execute(sql).fetchall()
+        ms = (time.perf_counter() - t0) * 1000 / repeticiones
+        print(f"{nombre:32s} {ms:8.3f} ms  plan: {plan}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--factor", type=int, default=50)
+    parser.add_argument("--repeticiones", type=int, default=20)
+    args = parser.parse_args()
+
+    from sqlalchemy import create_engine
+
+    from migraciones import (
+        _indices_propiedades,
+        _ingesta_incremental,
+        _quitar_indice_ubicacion_original,
+        _slugs_ubicacion,
+    )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = os.path.join(tmp, "bench.db")
+        shutil.copy(DB_ORIGEN, ruta)
+        engine = create_engine(f"sqlite:///{ruta}")
+
+        # Las columnas *_slug hacen falta para las consultas exactas/prefijo y
+        # ultima_ejecucion para la del planificador
+        with engine.begin() as sa_conn:
+            _slugs_ubicacion(sa_conn)
+            _ingesta_incremental(sa_conn)
+
+        conn = sqlite3.connect(ruta)
+        for ix in INDICES:
+            conn.execute(f"DROP INDEX IF EXISTS {ix}")
+        replicar(conn, args.factor)
+        total = conn.execute("SELECT count(*) FROM propiedades").fetchone()[0]
+        print(f"Filas en la copia: {total}")
+
+        medir(conn, "ANTES (sin índices)", args.repeticiones)
+
+        with engine.begin() as sa_conn:
+            _indices_propiedades(sa_conn)
+            # Índice de la migración 2 (sin volver a rellenar los slugs)
+            sa_conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_propiedades_op_slugs "
+                "ON propiedades (operation, city_slug, district_slug, neighborhood_slug)"
+            ))
+            _quitar_indice_ubicacion_original(sa_conn)
+        engine.dispose()
+        conn.execute("ANALYZE")
+
+        medir(conn, "DESPUÉS (migraciones 1, 2 y 9)", args.repeticiones)
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
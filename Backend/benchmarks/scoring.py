@@ -0,0 +1,132 @@
+"""
+Compara el scoring anuncio a anuncio con el scoring por lotes de
+services/scoring_lote.py sobre las filas de pisos.db: solo score_intrinseco
+(valoracion_intrinseca frente a score_intrinseco_lote) y los cuatro scores
+(puntuar_escalar, un bucle en Python con las mismas fórmulas, frente a
+puntuar_columnas).
+
+Uso (desde Backend/):
+    python -m benchmarks.scoring [--factor 200]
+
+--factor replica las filas N veces en memoria para tener un volumen
+parecido al de una tabla grande.
+"""
+import argparse
+import os
+import sqlite3
+import time
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+from services.estadisticas import zona_de
+from services.scoring import SCORE_MAX, SCORE_MIN, valoracion_intrinseca
+from services.scoring_lote import PESOS, parsear_planta, puntuar_columnas, referencias_zona, score_intrinseco_lote
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_ORIGEN = os.path.join(BASE_DIR, "pisos.db")
+
+
+def cargar(factor):
+    conn = sqlite3.connect(DB_ORIGEN)
+    filas = conn.execute(
+        "SELECT operation, district, price, size, floor, hasLift FROM propiedades "
+        "WHERE price IS NOT NULL AND size IS NOT NULL"
+    ).fetchall()
+    conn.close()
+    return filas * factor
+
+
+def score_planta(floor, has_lift):
+    planta = parsear_planta(floor)
+    if np.isnan(planta):
+        return None
+    for limite, score in ((0, 15.0), (0.5, 40.0), (1, 50.0), (2, 60.0), (4, 75.0)):
+        if planta < limite:
+            return score
+    return 90.0 if has_lift else max(15.0, 75.0 - 15.0 * (planta - 3))
+
+
+def puntuar_escalar(filas, referencias):
+    """Los cuatro scores de cada fila, anuncio a anuncio (referencias: clave -> lista ordenada)."""
+    resultado = []
+    for operation, district, price, size, floor, has_lift in filas:
+        operation = (operation or "rent").lower()
+        intrinseco = valoracion_intrinseca({"operation": operation, "price": price or 0, "size": size or 0})
+
+        zona = None
+        if price is not None and (operation == "rent" or (size or 0) > 0):
+            base = price if operation == "rent" else price / size
+            ref = referencias.get(f"{operation}|{zona_de(district)}")
+            if ref:
+                percentil = (bisect_left(ref, base) + bisect_right(ref, base)) / (2 * len(ref))
+                zona = round(SCORE_MIN + (SCORE_MAX - SCORE_MIN) * (1 - percentil), 2)
+        planta = score_planta(floor, has_lift)
+
+        suma, pesos = PESOS["intrinseco"] * intrinseco, PESOS["intrinseco"]
+        for score, peso in ((zona, PESOS["zona"]), (planta, PESOS["planta"])):
+            if score is not None:
+                suma += peso * score
+                pesos += peso
+        resultado.append((intrinseco, zona, planta, round(suma / pesos, 2)))
+    return resultado
+
+
+def cronometrar(nombre, funcion, repeticiones):
+    t0 = time.perf_counter()
+    for _ in range(repeticiones):
+        resultado = funcion()
+    ms = (time.perf_counter() - t0) * 1000 / repeticiones
+    print(f"{nombre:40s} {ms:10.2f} ms")
+    return resultado, ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--factor", type=int, default=200)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    filas = cargar(args.factor)
+    print(f"Anuncios: {len(filas)}")
+    operation, district, price, size, floor, has_lift = (list(c) for c in zip(*filas))
+    dicts = [{"operation": o, "price": p, "size": s} for o, _, p, s, _, _ in filas]
+
+    escalar, ms_escalar = cronometrar(
+        "valoracion_intrinseca (bucle)",
+        lambda: [valoracion_intrinseca(d) for d in dicts],
+        args.repeticiones,
+    )
+    op = np.char.lower(np.asarray(operation, dtype=str))
+    pr, sz = np.asarray(price, dtype=float), np.asarray(size, dtype=float)
+    lote, ms_lote = cronometrar(
+        "score_intrinseco_lote (NumPy)",
+        lambda: score_intrinseco_lote(op, pr, sz),
+        args.repeticiones,
+    )
+
+    referencias = referencias_zona(operation, district, price, size)
+    referencias_lista = {clave: ref.tolist() for clave, ref in referencias.items()}
+    escalar4, ms_escalar4 = cronometrar(
+        "puntuar_escalar (4 scores, bucle)",
+        lambda: puntuar_escalar(filas, referencias_lista),
+        args.repeticiones,
+    )
+    lote4, ms_lote4 = cronometrar(
+        "puntuar_columnas (4 scores, NumPy)",
+        lambda: puntuar_columnas(operation, district, price, size, floor, has_lift, referencias),
+        args.repeticiones,
+    )
+
+    diferencia = np.max(np.abs(np.asarray(escalar, dtype=float) - lote))
+    print(f"\nAceleración score_intrinseco: x{ms_escalar / ms_lote:.1f}")
+    print(f"Aceleración 4 scores: x{ms_escalar4 / ms_lote4:.1f}")
+    print(f"Diferencia máxima con la versión escalar: {diferencia:.4f} (score_intrinseco)")
+    escalar4 = np.asarray(escalar4, dtype=float)  # None -> NaN
+    for i, campo in enumerate(("score_intrinseco", "score_zona", "score_planta", "score_final")):
+        dif = np.nanmax(np.abs(escalar4[:, i] - lote4[campo]))
+        print(f"{'':42s}{dif:.4f} ({campo})")
+
+
+if __name__ == "__main__":
+    main()
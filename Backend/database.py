@@ -3,6 +3,7 @@ from sqlalchemy.orm import sessionmaker
 import os
 from dotenv import load_dotenv
 from models import Base
+from migraciones import aplicar_migraciones
 
 load_dotenv()
 
@@ -21,8 +22,9 @@ SessionLocal = sessionmaker(
 )
 
 def init_db():
-    """Crea las tablas si no existen en la base de datos principal."""
+    """Crea las tablas si no existen y aplica las migraciones pendientes."""
     Base.metadata.create_all(bind=engine)
+    aplicar_migraciones(engine)
     print("✅ Tablas creadas o verificadas correctamente")
 
 def get_db():
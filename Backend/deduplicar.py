@@ -0,0 +1,32 @@
+import argparse
+import time
+
+from database import SessionLocal, init_db
+from services.cache import incrementar_version_datos
+from services.casi_duplicados import marcar_casi_duplicados
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Marca los casi-duplicados de toda la tabla propiedades")
+    parser.add_argument("--dry-run", action="store_true", help="Calcula sin guardar cambios")
+    args = parser.parse_args()
+
+    init_db()
+    db = SessionLocal()
+    try:
+        inicio = time.monotonic()
+        marcados = marcar_casi_duplicados(db)
+        if args.dry_run:
+            db.rollback()
+        else:
+            # Las respuestas cacheadas llevan los casi_duplicado_de anteriores
+            incrementar_version_datos(db)
+            db.commit()
+        print(f"🔎 {marcados} casi-duplicados detectados en {time.monotonic() - inicio:.2f}s"
+              + (" (sin guardar)" if args.dry_run else ""))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
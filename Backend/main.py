@@ -1,15 +1,23 @@
 from fastapi import FastAPI, Depends, HTTPException, Query, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy import and_, func
 from sqlalchemy.orm import Session
 from database import get_db, init_db
-from models import Propiedad, User, Favorite, SearchHistory
+from models import Propiedad, User, Favorite, SearchHistory, Ubicacion, EstadisticaDistrito
 from services.idealista_api import IdealistaAPI
 from services.scoring import valoracion_intrinseca, generar_huella_digital
+from services.paginacion import paginar_por_cursor
+from services.formato_mapa import FORMATO_PATTERN, opciones_formato, serializar_propiedades
+from services.normalizacion import slug_ubicacion
+from services.cache import respuesta_cacheada
 from datetime import datetime, timedelta
-from math import radians, cos, sin, asin, sqrt
 from collections import defaultdict
-from statistics import mean
 from routers.heatmap_router import router as heatmap_router
+from routers.export_router import router as export_router
+from routers.area_router import router as area_router
+from routers.clusters_router import router as clusters_router
+from routers.ingesta_router import router as ingesta_router
+from services.programador import detener_programador, iniciar_programador
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
 from pydantic import BaseModel
@@ -78,9 +86,15 @@ class SearchHistoryOut(BaseModel):
     created_at: datetime
     query: dict
 
+COINCIDENCIA_PATTERN = "^(exacta|prefijo|parcial)$"
+
 security = HTTPBearer(auto_error=False)
 app = FastAPI(title="Buscador de Pisos API", version="5.0.0")
 app.include_router(heatmap_router)
+app.include_router(export_router)
+app.include_router(area_router)
+app.include_router(clusters_router)
+app.include_router(ingesta_router)
 
 # --- Configuración CORS para frontend Angular ---
 app.add_middleware(
@@ -98,13 +112,109 @@ app.add_middleware(
 
 # --- Funciones auxiliares ---
 
-def distancia_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    """Calcula la distancia entre dos coordenadas (km)."""
-    R = 6371
-    dlat = radians(lat2 - lat1)
-    dlon = radians(lon2 - lon1)
-    a = sin(dlat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2) ** 2
-    return 2 * R * asin(sqrt(a))
+def filtro_ubicacion(columna, columna_slug, valor: str, coincidencia: str):
+    """
+    Condición sobre municipio/distrito/barrio:
+    - exacta: igualdad sobre la columna *_slug (usa índice).
+    - prefijo: rango [slug, slug + U+FFFF) sobre *_slug (también usa índice).
+    - parcial: el antiguo ilike '%valor%' sobre la columna original (full scan).
+    """
+    if coincidencia == "parcial":
+        return columna.ilike(f"%{valor}%")
+
+    slug = slug_ubicacion(valor)
+    if coincidencia == "prefijo":
+        return and_(columna_slug >= slug, columna_slug < slug + "\uffff")
+    return columna_slug == slug
+
+
+def filtros_busqueda(
+    operation: str,
+    municipio: str,
+    distrito: Optional[str] = None,
+    barrio: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    min_size: Optional[float] = None,
+    max_size: Optional[float] = None,
+    rooms: Optional[int] = None,
+    hasLift: Optional[bool] = None,
+    coincidencia: str = "exacta",
+) -> list:
+    """
+    Construye la lista de condiciones SQL de /buscar para poder reutilizarla
+    tanto en la consulta paginada como en la agregada (total + stats).
+    """
+    filtros = [
+        Propiedad.operation == operation,
+        # Los anuncios dados de baja por la ingesta incremental no se muestran
+        Propiedad.activo.isnot(False),
+        # 1) Filtro base: municipio (city)
+        filtro_ubicacion(Propiedad.city, Propiedad.city_slug, municipio, coincidencia),
+    ]
+
+    # 2) Refinar por distrito si viene
+    if distrito:
+        filtros.append(
+            filtro_ubicacion(Propiedad.district, Propiedad.district_slug, distrito, coincidencia)
+        )
+
+    # 3) Refinar por barrio si viene
+    if barrio:
+        filtros.append(
+            filtro_ubicacion(Propiedad.neighborhood, Propiedad.neighborhood_slug, barrio, coincidencia)
+        )
+
+    # Filtros numéricos
+    if min_price is not None:
+        filtros.append(Propiedad.price >= min_price)
+    if max_price is not None:
+        filtros.append(Propiedad.price <= max_price)
+    if min_size is not None:
+        filtros.append(Propiedad.size >= min_size)
+    if max_size is not None:
+        filtros.append(Propiedad.size <= max_size)
+    if rooms is not None:
+        filtros.append(Propiedad.rooms >= rooms)
+    if hasLift is not None:
+        filtros.append(Propiedad.hasLift == hasLift)
+
+    return filtros
+
+
+def stats_busqueda(db: Session, filtros: list):
+    """Calcula total y min/max de precio, tamaño y score en una sola consulta agregada."""
+    agregados = (
+        db.query(
+            func.count(Propiedad.propertyCode),
+            func.min(Propiedad.price),
+            func.max(Propiedad.price),
+            func.min(Propiedad.size),
+            func.max(Propiedad.size),
+            func.min(Propiedad.score_intrinseco),
+            func.max(Propiedad.score_intrinseco),
+        )
+        .filter(*filtros)
+        .one()
+    )
+    total, precio_min, precio_max, tamano_min, tamano_max, score_min, score_max = agregados
+
+    stats = {
+        "price": {
+            "min": precio_min if precio_min is not None else 0,
+            "max": precio_max if precio_max is not None else 0,
+        },
+        "size": {
+            "min": tamano_min if tamano_min is not None else 0,
+            "max": tamano_max if tamano_max is not None else 0,
+        },
+        "score": {
+            "min": score_min if score_min is not None else 0,
+            "max": score_max if score_max is not None else 100,
+        },
+    }
+
+    return total, stats
 
 
 def db_from_request(request: Request):
@@ -191,6 +301,13 @@ def on_startup():
     init_db()
     seed_default_users()
     print("✅ Base de datos inicializada correctamente")
+    # Ingesta periódica en segundo plano (solo si INGESTA_AUTOMATICA=1)
+    iniciar_programador()
+
+
+@app.on_event("shutdown")
+def on_shutdown():
+    detener_programador()
 
 
 # --------------------------------------------------------------
@@ -251,7 +368,12 @@ def buscar_propiedades(
     rooms: Optional[int] = Query(None),
     hasLift: Optional[bool] = Query(None),
     page: int = Query(1, ge=1),
-    per_page: int = Query(20, le=100),
+    per_page: int = Query(20, ge=1, le=100),
+    paginacion: str = Query("pagina", pattern="^(pagina|cursor)$"),
+    cursor: Optional[str] = Query(None, description="Cursor devuelto en next_cursor"),
+    orden: str = Query("propertyCode", description="propertyCode, price, -price, score, -score"),
+    formato: str = Query("completo", pattern=FORMATO_PATTERN, description="completo o columnas (payload compacto para el mapa)"),
+    coincidencia: str = Query("exacta", pattern=COINCIDENCIA_PATTERN, description="exacta, prefijo o parcial (subcadena, lento)"),
     db: Session = Depends(db_from_request),
 ):
     """
@@ -263,65 +385,68 @@ def buscar_propiedades(
     - barrio: refina por neighborhood (opcional).
 
     Además aplica filtros numéricos (precio, tamaño, habitaciones, ascensor) y paginación.
+
+    Por defecto la ubicación se compara exacta contra las columnas *_slug (sin
+    tildes ni mayúsculas); coincidencia=prefijo o parcial amplían la búsqueda.
+
+    Con paginacion=cursor (o si llega un cursor) se usa paginación keyset:
+    la respuesta incluye next_cursor y el total/stats solo se calculan en
+    la primera página.
+
+    Con formato=columnas solo se envían los campos del mapa en arrays por columna.
     """
     # Normalizar a minúsculas / quitar espacios
     municipio = municipio.strip().lower()
     distrito = distrito.strip().lower() if distrito else None
     barrio = barrio.strip().lower() if barrio else None
 
-    query = db.query(Propiedad).filter(Propiedad.operation == operation)
-
-    # 1) Filtro base: municipio (city)
-    query = query.filter(Propiedad.city.ilike(f"%{municipio}%"))
-
-    # 2) Refinar por distrito si viene
-    if distrito:
-        query = query.filter(Propiedad.district.ilike(f"%{distrito}%"))
-
-    # 3) Refinar por barrio si viene
-    if barrio:
-        query = query.filter(Propiedad.neighborhood.ilike(f"%{barrio}%"))
-
-    # Filtros numéricos
-    if min_price is not None:
-        query = query.filter(Propiedad.price >= min_price)
-    if max_price is not None:
-        query = query.filter(Propiedad.price <= max_price)
-    if min_size is not None:
-        query = query.filter(Propiedad.size >= min_size)
-    if max_size is not None:
-        query = query.filter(Propiedad.size <= max_size)
-    if rooms is not None:
-        query = query.filter(Propiedad.rooms >= rooms)
-    if hasLift is not None:
-        query = query.filter(Propiedad.hasLift == hasLift)
-
-    props_filtradas = query.all()
-
-    total = len(props_filtradas)
-    inicio = (page - 1) * per_page
-    fin = inicio + per_page
-    props_page = props_filtradas[inicio:fin]
+    filtros = filtros_busqueda(
+        operation=operation,
+        municipio=municipio,
+        distrito=distrito,
+        barrio=barrio,
+        min_price=min_price,
+        max_price=max_price,
+        min_size=min_size,
+        max_size=max_size,
+        rooms=rooms,
+        hasLift=hasLift,
+        coincidencia=coincidencia,
+    )
 
-    # Estadísticas básicas
-    precios = [p.price for p in props_filtradas if p.price is not None]
-    tamanos = [p.size for p in props_filtradas if p.size is not None]
-    scores = [p.score_intrinseco for p in props_filtradas if p.score_intrinseco is not None]
+    modo_cursor = paginacion == "cursor" or cursor is not None
 
-    stats = {
-        "price": {
-            "min": min(precios) if precios else 0,
-            "max": max(precios) if precios else 0,
-        },
-        "size": {
-            "min": min(tamanos) if tamanos else 0,
-            "max": max(tamanos) if tamanos else 0,
-        },
-        "score": {
-            "min": min(scores) if scores else 0,
-            "max": max(scores) if scores else 100,
-        },
-    }
+    if modo_cursor:
+        props_page, next_cursor = paginar_por_cursor(
+            opciones_formato(db.query(Propiedad).filter(*filtros), formato), orden, cursor, per_page
+        )
+        respuesta = {
+            "municipio": municipio,
+            "distrito": distrito,
+            "barrio": barrio,
+            "operation": operation,
+            "por_pagina": per_page,
+            **serializar_propiedades(props_page, formato),
+            "next_cursor": next_cursor,
+        }
+        # En las páginas siguientes no se repite el COUNT ni las stats
+        if not cursor:
+            total, stats = stats_busqueda(db, filtros)
+            respuesta["total"] = total
+            respuesta["stats"] = stats
+        return respuesta
+
+    total, stats = stats_busqueda(db, filtros)
+
+    # Solo se cargan las filas de la página pedida (LIMIT/OFFSET en SQL)
+    props_page = (
+        opciones_formato(db.query(Propiedad), formato)
+        .filter(*filtros)
+        .order_by(Propiedad.propertyCode)
+        .offset((page - 1) * per_page)
+        .limit(per_page)
+        .all()
+    )
 
     return {
         "municipio": municipio,
@@ -331,7 +456,7 @@ def buscar_propiedades(
         "total": total,
         "pagina": page,
         "por_pagina": per_page,
-        "propiedades": [p.as_dict() for p in props_page],
+        **serializar_propiedades(props_page, formato),
         "stats": stats,
     }
 
@@ -339,6 +464,7 @@ def buscar_propiedades(
 # 🌍 Zonas jerárquicas automáticas (para el buscador)
 @app.get("/zonas-jerarquicas")
 def obtener_zonas_jerarquicas(
+    request: Request,
     operation: Optional[str] = Query(
         None,
         description="Filtrar zonas que tienen al menos una propiedad de este tipo de operación (rent/sale)"
@@ -347,104 +473,144 @@ def obtener_zonas_jerarquicas(
         None,
         description="Filtrar por municipio (city) si se desea"
     ),
+    coincidencia: str = Query("exacta", pattern=COINCIDENCIA_PATTERN),
+    conteos: bool = Query(False, description="Incluir el nº de anuncios de cada nodo"),
     db: Session = Depends(db_from_request),
 ):
-    jerarquia = defaultdict(lambda: defaultdict(set))
-
-    query = db.query(
-        Propiedad.city,
-        Propiedad.district,
-        Propiedad.neighborhood,
-    ).distinct()
-
-    # 🔹 Filtrado por operación (rent / sale)
-    if operation:
-        query = query.filter(Propiedad.operation == operation)
-
-    # 🔹 Filtrado por municipio si lo quieres limitar (ej. "madrid")
-    if municipio:
-        muni_norm = municipio.strip().lower()
-        query = query.filter(Propiedad.city.ilike(f"%{muni_norm}%"))
-
-    props = query.all()
+    """
+    Lee la jerarquía municipio > distrito > barrio de la tabla ubicaciones,
+    que se mantiene en la ingesta, en lugar de recorrer propiedades.
 
-    for city, district, neighborhood in props:
-        if not city:
-            continue
+    - conteos=false: {municipio: {distrito: [barrios]}} (forma original).
+    - conteos=true: {municipio: {"count", "distritos": {distrito: {"count", "barrios": {barrio: count}}}}}
+    """
+    def calcular():
+        query = db.query(
+            Ubicacion.city,
+            Ubicacion.district,
+            Ubicacion.neighborhood,
+            Ubicacion.count,
+        ).filter(Ubicacion.count > 0)
+
+        # 🔹 Filtrado por operación (rent / sale)
+        if operation:
+            query = query.filter(Ubicacion.operation == operation)
+
+        # 🔹 Filtrado por municipio si lo quieres limitar (ej. "madrid")
+        if municipio:
+            muni_norm = municipio.strip().lower()
+            query = query.filter(
+                filtro_ubicacion(Ubicacion.city, Ubicacion.city_slug, muni_norm, coincidencia)
+            )
 
-        city = city.strip()
-        district = (district or "Desconocido").strip()
-        neighborhood = (neighborhood or "").strip()
+        # municipio -> distrito -> barrio -> nº anuncios (sumando operaciones)
+        jerarquia = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
+        for city, district, neighborhood, count in query.all():
+            jerarquia[city][district][neighborhood] += count
+
+        result = {}
+        for city, distritos in jerarquia.items():
+            if not conteos:
+                result[city] = {
+                    d: sorted(b for b in barrios if b) for d, barrios in distritos.items()
+                }
+                continue
+
+            result[city] = {
+                "count": sum(sum(b.values()) for b in distritos.values()),
+                "distritos": {
+                    d: {
+                        "count": sum(barrios.values()),
+                        "barrios": {b: n for b, n in sorted(barrios.items()) if b},
+                    }
+                    for d, barrios in distritos.items()
+                },
+            }
 
-        jerarquia[city][district].add(neighborhood)
+        return result
 
-    # Convertir sets a listas ordenadas
-    result = {}
-    for city, distritos in jerarquia.items():
-        result[city] = {}
-        for d, barrios in distritos.items():
-            barrios_limpios = sorted([b for b in barrios if b])
-            result[city][d] = barrios_limpios
+    return respuesta_cacheada(request, db, calcular)
 
-    return result
 
 # 🌐 Buscar todo (sin filtros de zona)
 @app.get("/buscar-todo")
 def buscar_todo(
+    request: Request,
     operation: Optional[str] = Query(None),
     page: int = Query(1, ge=1),
-    per_page: int = Query(500, le=1000),
+    per_page: int = Query(500, ge=1, le=1000),
+    paginacion: str = Query("pagina", pattern="^(pagina|cursor)$"),
+    cursor: Optional[str] = Query(None, description="Cursor devuelto en next_cursor"),
+    orden: str = Query("propertyCode", description="propertyCode, price, -price, score, -score"),
+    formato: str = Query("completo", pattern=FORMATO_PATTERN, description="completo o columnas (payload compacto para el mapa)"),
     db: Session = Depends(db_from_request),
 ):
-    """Devuelve todas las propiedades, opcionalmente filtradas por tipo de operación."""
-    query = db.query(Propiedad)
-    if operation:
-        query = query.filter(Propiedad.operation == operation)
+    """
+    Devuelve todas las propiedades, opcionalmente filtradas por tipo de operación.
 
-    total = query.count()
-    props = query.offset((page - 1) * per_page).limit(per_page).all()
+    Con paginacion=cursor se recorre el catálogo por keyset (orden + propertyCode):
+    cada página cuesta lo mismo sin importar lo lejos que esté, y el COUNT
+    solo se hace en la primera.
 
-    return {
-        "total": total,
-        "pagina": page,
-        "por_pagina": per_page,
-        "propiedades": [p.as_dict() for p in props],
-        "origen": "base_local",
-    }
+    Con formato=columnas solo se envían los campos del mapa en arrays por columna.
+    """
+    def calcular():
+        query = db.query(Propiedad).filter(Propiedad.activo.isnot(False))
+        if operation:
+            query = query.filter(Propiedad.operation == operation)
+
+        if paginacion == "cursor" or cursor is not None:
+            props, next_cursor = paginar_por_cursor(
+                opciones_formato(query, formato), orden, cursor, per_page
+            )
+            respuesta = {
+                "por_pagina": per_page,
+                **serializar_propiedades(props, formato),
+                "next_cursor": next_cursor,
+                "origen": "base_local",
+            }
+            if not cursor:
+                respuesta["total"] = query.count()
+            return respuesta
+
+        total = query.count()
+        props = opciones_formato(query, formato).offset((page - 1) * per_page).limit(per_page).all()
+
+        return {
+            "total": total,
+            "pagina": page,
+            "por_pagina": per_page,
+            **serializar_propiedades(props, formato),
+            "origen": "base_local",
+        }
+
+    return respuesta_cacheada(request, db, calcular)
 
 
 # 📊 Estadísticas globales agrupadas por distrito
 @app.get("/estadisticas-globales")
-def estadisticas_por_zona(db: Session = Depends(db_from_request)):
-    props = db.query(Propiedad).all()
-
-    # zona -> op -> [propiedades]
-    agrupado = defaultdict(lambda: defaultdict(list))
-
-    for p in props:
-        zona = (p.district or "Desconocido").strip()
-        op = (p.operation or "desconocido").strip()
-        agrupado[zona][op].append(p)
-
-    resultado = {}
-
-    for zona, por_op in agrupado.items():
-        resultado[zona] = {}
-        for op, lista in por_op.items():
-            precios = [p.price for p in lista if p.price is not None]
-            tamanos = [p.size for p in lista if p.size is not None]
-            scores = [p.score_intrinseco for p in lista if p.score_intrinseco is not None]
-
-            resultado[zona][op] = {
-                "count": len(lista),
-                "precio_medio": mean(precios) if precios else 0,
-                "tamano_medio": mean(tamanos) if tamanos else 0,
-                "score_medio": mean(scores) if scores else 0,
-                "precio_min": min(precios) if precios else 0,
-                "precio_max": max(precios) if precios else 0,
+def estadisticas_por_zona(request: Request, db: Session = Depends(db_from_request)):
+    """
+    Lee los agregados materializados en estadisticas_distrito, que
+    update_all.py mantiene al día, en vez de recorrer todas las propiedades.
+    """
+    def calcular():
+        resultado = defaultdict(dict)
+
+        for fila in db.query(EstadisticaDistrito).all():
+            resultado[fila.zona][fila.operation] = {
+                "count": fila.count,
+                "precio_medio": fila.precio_medio,
+                "tamano_medio": fila.tamano_medio,
+                "score_medio": fila.score_medio,
+                "precio_min": fila.precio_min,
+                "precio_max": fila.precio_max,
             }
 
-    return resultado
+        return resultado
+
+    return respuesta_cacheada(request, db, calcular)
+
 
 # --------------------------------------------------------------
 #                      FAVORITOS POR USUARIO
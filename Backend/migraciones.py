@@ -0,0 +1,194 @@
+"""
+Migrador de esquema muy sencillo, sin Alembic.
+
+`Base.metadata.create_all` crea las tablas nuevas, pero no añade índices ni
+columnas a tablas que ya existen (como la pisos.db desplegada). Cada entrada
+de MIGRACIONES es un paso idempotente que se aplica una sola vez y queda
+registrado en la tabla schema_migrations.
+"""
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import Session
+
+from models import MigracionAplicada
+from services.normalizacion import slug_ubicacion
+from services.ubicaciones import reconstruir_ubicaciones
+from services.estadisticas import refrescar_estadisticas
+from services.heatmap_tiles import reconstruir_heatmap
+from services.clusters import reconstruir_clusters
+from services.umbrales import refrescar_umbrales
+
+
+def _columnas(conn, tabla):
+    return {c["name"] for c in inspect(conn).get_columns(tabla)}
+
+
+def _indices_propiedades(conn):
+    """Índices compuestos para los filtros habituales de los endpoints."""
+    sentencias = [
+        "CREATE INDEX IF NOT EXISTS ix_propiedades_op_city_district_neigh "
+        "ON propiedades (operation, city, district, neighborhood)",
+        "CREATE INDEX IF NOT EXISTS ix_propiedades_op_price "
+        "ON propiedades (operation, price)",
+        "CREATE INDEX IF NOT EXISTS ix_propiedades_op_lat_lon "
+        "ON propiedades (operation, latitude, longitude)",
+        "CREATE INDEX IF NOT EXISTS ix_propiedades_huella_digital "
+        "ON propiedades (huella_digital)",
+    ]
+    for sql in sentencias:
+        conn.execute(text(sql))
+
+
+def _slugs_ubicacion(conn):
+    """Columnas city/district/neighborhood_slug, su índice y el relleno inicial."""
+    existentes = _columnas(conn, "propiedades")
+    for col in ("city_slug", "district_slug", "neighborhood_slug"):
+        if col not in existentes:
+            conn.execute(text(f"ALTER TABLE propiedades ADD COLUMN {col} VARCHAR(100)"))
+
+    filas = conn.execute(
+        text('SELECT "propertyCode", city, district, neighborhood FROM propiedades')
+    ).fetchall()
+    if filas:
+        conn.execute(
+            text(
+                "UPDATE propiedades SET city_slug = :c, district_slug = :d, "
+                'neighborhood_slug = :n WHERE "propertyCode" = :pk'
+            ),
+            [
+                {
+                    "pk": pk,
+                    "c": slug_ubicacion(city),
+                    "d": slug_ubicacion(district),
+                    "n": slug_ubicacion(neighborhood),
+                }
+                for pk, city, district, neighborhood in filas
+            ],
+        )
+
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_propiedades_op_slugs "
+        "ON propiedades (operation, city_slug, district_slug, neighborhood_slug)"
+    ))
+
+
+def _rellenar_ubicaciones(conn):
+    """Carga inicial de la tabla ubicaciones a partir de propiedades."""
+    # La reconstrucción filtra por activo, que añade la migración 8
+    _ingesta_incremental(conn)
+    with Session(bind=conn) as db:
+        reconstruir_ubicaciones(db)
+        db.flush()
+
+
+def _rellenar_estadisticas(conn):
+    """Carga inicial de estadisticas_distrito a partir de propiedades."""
+    # La reconstrucción filtra por activo, que añade la migración 8
+    _ingesta_incremental(conn)
+    with Session(bind=conn) as db:
+        refrescar_estadisticas(db)
+        db.flush()
+
+
+def _rellenar_heatmap(conn):
+    """Carga inicial de la pirámide heatmap_celdas a partir de propiedades."""
+    # La reconstrucción filtra por activo, que añade la migración 8
+    _ingesta_incremental(conn)
+    with Session(bind=conn) as db:
+        reconstruir_heatmap(db)
+        db.flush()
+
+
+def _rellenar_clusters(conn):
+    """Carga inicial de clusters_mapa a partir de propiedades."""
+    # La reconstrucción filtra por activo, que añade la migración 8
+    _ingesta_incremental(conn)
+    with Session(bind=conn) as db:
+        reconstruir_clusters(db)
+        db.flush()
+
+
+def _rellenar_umbrales(conn):
+    """Carga inicial de umbrales_zona a partir de propiedades."""
+    with Session(bind=conn) as db:
+        refrescar_umbrales(db)
+        db.flush()
+
+
+def _ingesta_incremental(conn):
+    """Columnas de la ingesta incremental en propiedades."""
+    existentes = _columnas(conn, "propiedades")
+    nuevas = {
+        "hash_contenido": "VARCHAR(32)",
+        "activo": "BOOLEAN DEFAULT TRUE",
+        "ultima_ejecucion": "INTEGER",
+    }
+    for col, tipo in nuevas.items():
+        if col not in existentes:
+            conn.execute(text(f"ALTER TABLE propiedades ADD COLUMN {col} {tipo}"))
+    conn.execute(text("UPDATE propiedades SET activo = TRUE WHERE activo IS NULL"))
+
+
+def _quitar_indice_ubicacion_original(conn):
+    """
+    Desde la migración 2 /buscar filtra por los *_slug; el índice sobre
+    city/district/neighborhood ya no lo usa ninguna consulta habitual y solo
+    encarece cada escritura.
+    """
+    conn.execute(text("DROP INDEX IF EXISTS ix_propiedades_op_city_district_neigh"))
+
+
+def _casi_duplicados_separados(conn):
+    """
+    Columna casi_duplicado_de. Los casi-duplicados que deduplicar.py había
+    marcado en es_duplicado/propiedad_original (huella distinta de la de su
+    original) pasan a la columna nueva: la ingesta reescribe las otras dos.
+    """
+    if "casi_duplicado_de" not in _columnas(conn, "propiedades"):
+        conn.execute(text("ALTER TABLE propiedades ADD COLUMN casi_duplicado_de VARCHAR(50)"))
+    conn.execute(text(
+        "UPDATE propiedades SET casi_duplicado_de = propiedad_original, "
+        "es_duplicado = FALSE, propiedad_original = NULL "
+        "WHERE es_duplicado AND propiedad_original IS NOT NULL "
+        # Comparación NULL-safe portable (IS NOT con subconsulta es solo de SQLite)
+        "AND NOT EXISTS (SELECT 1 FROM propiedades o "
+        'WHERE o."propertyCode" = propiedades.propiedad_original '
+        "AND (o.huella_digital = propiedades.huella_digital "
+        "OR (o.huella_digital IS NULL AND propiedades.huella_digital IS NULL)))"
+    ))
+
+
+# (versión, nombre, función) — añadir siempre al final, nunca reordenar
+MIGRACIONES = [
+    (1, "indices_propiedades", _indices_propiedades),
+    (2, "slugs_ubicacion", _slugs_ubicacion),
+    (3, "rellenar_ubicaciones", _rellenar_ubicaciones),
+    (4, "rellenar_estadisticas", _rellenar_estadisticas),
+    (5, "rellenar_heatmap", _rellenar_heatmap),
+    (6, "rellenar_clusters", _rellenar_clusters),
+    (7, "rellenar_umbrales", _rellenar_umbrales),
+    (8, "ingesta_incremental", _ingesta_incremental),
+    (9, "quitar_indice_ubicacion_original", _quitar_indice_ubicacion_original),
+    (10, "casi_duplicados_separados", _casi_duplicados_separados),
+]
+
+
+def aplicar_migraciones(engine):
+    """Aplica en orden las migraciones pendientes, cada una en su transacción."""
+    with engine.connect() as conn:
+        aplicadas = {
+            v for (v,) in conn.execute(text(f"SELECT version FROM {MigracionAplicada.__tablename__}"))
+        }
+
+    for version, nombre, funcion in MIGRACIONES:
+        if version in aplicadas:
+            continue
+        with engine.begin() as conn:
+            funcion(conn)
+            conn.execute(
+                MigracionAplicada.__table__.insert().values(
+                    version=version, nombre=nombre, aplicada_en=datetime.now()
+                )
+            )
+        print(f"✅ Migración {version} ({nombre}) aplicada")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Float, Boolean, DateTime, Text, ForeignKey
+from sqlalchemy import Column, String, Integer, Float, Boolean, DateTime, Text, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -26,6 +26,8 @@ class Propiedad(Base):
     huella_digital = Column(String(32))
     es_duplicado = Column(Boolean, default=False)
     propiedad_original = Column(String(50), nullable=True)
+    # Casi-duplicados (services/casi_duplicados.py); aparte para que la ingesta no los pise
+    casi_duplicado_de = Column(String(50), nullable=True)
     score_intrinseco = Column(Float)
     score_zona = Column(Float)
     score_planta = Column(Float)
@@ -34,6 +36,22 @@ class Propiedad(Base):
     fecha_actualizacion = Column(DateTime, default=datetime.now, onupdate=datetime.now)
     city = Column(String(100))
     address = Column(String(255))
+    # Versiones normalizadas (sin tildes, minúsculas) para filtrar con índice
+    city_slug = Column(String(100))
+    district_slug = Column(String(100))
+    neighborhood_slug = Column(String(100))
+    # Ingesta incremental (services/incremental.py)
+    hash_contenido = Column(String(32))
+    activo = Column(Boolean, default=True)
+    ultima_ejecucion = Column(Integer)
+
+    # Índices según las consultas reales (ver migraciones.py)
+    __table_args__ = (
+        Index("ix_propiedades_op_price", "operation", "price"),
+        Index("ix_propiedades_op_lat_lon", "operation", "latitude", "longitude"),
+        Index("ix_propiedades_huella_digital", "huella_digital"),
+        Index("ix_propiedades_op_slugs", "operation", "city_slug", "district_slug", "neighborhood_slug"),
+    )
 
     def as_dict(self):
         return {
@@ -55,6 +73,8 @@ class Propiedad(Base):
             "huella_digital": self.huella_digital,
             "es_duplicado": self.es_duplicado,
             "propiedad_original": self.propiedad_original,
+            "casi_duplicado_de": self.casi_duplicado_de,
+            "activo": self.activo,
             "score_intrinseco": self.score_intrinseco,
             "score_zona": self.score_zona,
             "score_planta": self.score_planta,
@@ -64,6 +84,182 @@ class Propiedad(Base):
             "city": self.city,
         }
 
+class Ubicacion(Base):
+    """
+    Dimensión de ubicaciones (municipio > distrito > barrio) por operación,
+    con el nº de anuncios de cada hoja. Se mantiene en la ingesta
+    (services/ubicaciones.py) para no recorrer propiedades en /zonas-jerarquicas.
+    """
+    __tablename__ = "ubicaciones"
+
+    id = Column(Integer, primary_key=True)
+    operation = Column(String(10), nullable=False)
+    city = Column(String(100), nullable=False)
+    district = Column(String(100), nullable=False)
+    neighborhood = Column(String(100), nullable=False, default="")
+    city_slug = Column(String(100), nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("operation", "city", "district", "neighborhood", name="uq_ubicaciones_nodo"),
+        Index("ix_ubicaciones_op_city_slug", "operation", "city_slug"),
+    )
+
+
+class EstadisticaDistrito(Base):
+    """
+    Agregados por distrito y operación que sirve /estadisticas-globales.
+    Se recalculan en la ingesta solo para los distritos tocados
+    (services/estadisticas.py).
+    """
+    __tablename__ = "estadisticas_distrito"
+
+    zona = Column(String(100), primary_key=True)
+    operation = Column(String(10), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    precio_medio = Column(Float, default=0)
+    tamano_medio = Column(Float, default=0)
+    score_medio = Column(Float, default=0)
+    precio_min = Column(Float, default=0)
+    precio_max = Column(Float, default=0)
+    actualizado_en = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+
+class HeatmapCelda(Base):
+    """
+    Pirámide de celdas del heatmap precalculada en la ingesta
+    (services/heatmap_tiles.py). `nivel` es el índice en NIVELES_HEATMAP y
+    celda_lat/celda_lon son floor(lat / tamaño) y floor(lon / tamaño).
+    """
+    __tablename__ = "heatmap_celdas"
+
+    operation = Column(String(10), primary_key=True)
+    nivel = Column(Integer, primary_key=True)
+    celda_lat = Column(Integer, primary_key=True)
+    celda_lon = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    suma_score = Column(Float, nullable=False, default=0)
+
+
+class ClusterMapa(Base):
+    """
+    Clusters de marcadores precalculados por nivel de zoom (rejilla sobre
+    teselas Web Mercator, ver services/clusters.py). Guarda sumas para poder
+    actualizar centroides y medias de forma incremental en la ingesta.
+    """
+    __tablename__ = "clusters_mapa"
+
+    operation = Column(String(10), primary_key=True)
+    zoom = Column(Integer, primary_key=True)
+    celda_x = Column(Integer, primary_key=True)
+    celda_y = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    suma_lat = Column(Float, nullable=False, default=0)
+    suma_lon = Column(Float, nullable=False, default=0)
+    suma_precio = Column(Float, nullable=False, default=0)
+    n_precio = Column(Integer, nullable=False, default=0)
+    suma_score = Column(Float, nullable=False, default=0)
+    n_score = Column(Integer, nullable=False, default=0)
+
+
+class VersionDatos(Base):
+    """
+    Contador global que update_all.py incrementa cada vez que escribe datos.
+    La caché de respuestas lo incluye en la clave para invalidarse sola.
+    """
+    __tablename__ = "version_datos"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    actualizado_en = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+
+class HistorialPrecio(Base):
+    """Un registro por cambio de precio detectado en la ingesta."""
+    __tablename__ = "price_history"
+
+    id = Column(Integer, primary_key=True)
+    property_code = Column(String(50), nullable=False)
+    fecha = Column(DateTime, default=datetime.now, nullable=False)
+    precio_anterior = Column(Float)
+    precio = Column(Float)
+
+    __table_args__ = (
+        Index("ix_price_history_code_fecha", "property_code", "fecha"),
+    )
+
+
+class EjecucionIngesta(Base):
+    """Una fila por ejecución de update_all.py (o del planificador)."""
+    __tablename__ = "ejecuciones_ingesta"
+
+    id = Column(Integer, primary_key=True)
+    modo = Column(String(20))
+    inicio = Column(DateTime, default=datetime.now)
+    fin = Column(DateTime, nullable=True)
+    llamadas = Column(Integer, default=0)
+    nuevas = Column(Integer, default=0)
+    actualizadas = Column(Integer, default=0)
+    sin_cambios = Column(Integer, default=0)
+    inactivadas = Column(Integer, default=0)
+    error = Column(Text, nullable=True)
+
+
+class AreaEjecucion(Base):
+    """
+    Círculos que una ejecución de ingesta ha buscado enteros (todas las
+    páginas sin errores). Sirven para contar cuántas ejecuciones seguidas han
+    cubierto la posición de un anuncio sin verlo (services/incremental.py).
+    """
+    __tablename__ = "areas_ejecucion"
+
+    id = Column(Integer, primary_key=True)
+    ejecucion_id = Column(Integer, nullable=False)
+    operation = Column(String(10), nullable=False)
+    latitude = Column(Float, nullable=False)
+    longitude = Column(Float, nullable=False)
+    radio_km = Column(Float, nullable=False)
+
+    __table_args__ = (
+        Index("ix_areas_ejecucion_op_ejecucion", "operation", "ejecucion_id"),
+    )
+
+
+class CeldaPlanificador(Base):
+    """
+    Historial de búsquedas por celda de la rejilla del planificador
+    (services/planificador.py): cuándo se buscó por última vez y qué salió.
+    """
+    __tablename__ = "celdas_planificador"
+
+    operation = Column(String(10), primary_key=True)
+    celda_lat = Column(Integer, primary_key=True)
+    celda_lon = Column(Integer, primary_key=True)
+    ultima_busqueda = Column(DateTime)
+    busquedas = Column(Integer, nullable=False, default=0)
+    llamadas = Column(Integer, nullable=False, default=0)
+    vistos = Column(Integer, nullable=False, default=0)
+    nuevas = Column(Integer, nullable=False, default=0)
+
+
+class UmbralZona(Base):
+    """
+    Cuantiles de precio (alquiler) o €/m² (venta) por municipio y distrito,
+    calculados de los datos guardados (services/umbrales.py). district_slug
+    vacío es la fila del municipio entero.
+    """
+    __tablename__ = "umbrales_zona"
+
+    operation = Column(String(10), primary_key=True)
+    city_slug = Column(String(100), primary_key=True)
+    district_slug = Column(String(100), primary_key=True)
+    n = Column(Integer, nullable=False, default=0)
+    p10 = Column(Float)
+    p50 = Column(Float)
+    p90 = Column(Float)
+    actualizado_en = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -101,4 +297,13 @@ class SearchHistory(Base):
     query = Column(Text, nullable=True)  # por ejemplo un JSON con la búsqueda
     created_at = Column(DateTime, default=datetime.now)
 
-    user = relationship("User", back_populates="search_history")
\ No newline at end of file
+    user = relationship("User", back_populates="search_history")
+
+
+class MigracionAplicada(Base):
+    """Registro de las migraciones de esquema ya aplicadas (ver migraciones.py)."""
+    __tablename__ = "schema_migrations"
+
+    version = Column(Integer, primary_key=True)
+    nombre = Column(String(100), nullable=False)
+    aplicada_en = Column(DateTime, default=datetime.now)
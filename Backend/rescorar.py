@@ -0,0 +1,208 @@
+"""
+Recalcula los scores de toda la tabla propiedades sin volver a descargar de
+Idealista (por ejemplo, tras cambiar UMBRALES en services/scoring.py).
+
+- Lee la tabla por trozos ordenados por propertyCode (keyset, sin OFFSET).
+- Puntúa los trozos en un pool de procesos con services/scoring_lote.py.
+- Escribe cada trozo con un UPDATE masivo en su propia transacción, así que
+  el bloqueo de escritura dura milisegundos.
+- Guarda el último propertyCode escrito en un fichero de progreso: si se
+  corta, `--reanudar` sigue desde ahí.
+
+Con `--modo zona` se recalculan antes los umbrales por zona
+(services/umbrales.py) y score_intrinseco se puntúa con ellos.
+
+Uso (desde Backend/):
+    python rescorar.py [--trozo 5000] [--workers 4] [--reanudar] [--modo fijo|zona]
+"""
+import argparse
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy import update
+
+from database import BASE_DIR, SessionLocal, init_db
+from models import Propiedad, UmbralZona
+from services.cache import incrementar_version_datos
+from services.clusters import reconstruir_clusters
+from services.estadisticas import refrescar_estadisticas
+from services.heatmap_tiles import reconstruir_heatmap
+from services.scoring_lote import cargar_referencias, puntuar_columnas
+from services.umbrales import MODOS_SCORING, SCORING_MODO, TablaUmbrales, refrescar_umbrales
+
+FICHERO_PROGRESO = os.path.join(BASE_DIR, "rescorar_progreso.json")
+
+COLUMNAS = (
+    Propiedad.propertyCode,
+    Propiedad.operation,
+    Propiedad.district,
+    Propiedad.price,
+    Propiedad.size,
+    Propiedad.floor,
+    Propiedad.hasLift,
+    Propiedad.city_slug,
+    Propiedad.district_slug,
+)
+
+# Referencias de score_zona y umbrales (modo "zona") de toda la tabla; se
+# copian una vez a cada worker
+_referencias = None
+_umbrales = None
+
+
+def _iniciar_worker(referencias, umbrales):
+    global _referencias, _umbrales
+    _referencias, _umbrales = referencias, umbrales
+
+
+def puntuar_trozo(filas):
+    """Devuelve los mappings {propertyCode, scores...} de un trozo de filas."""
+    codigos, operation, district, price, size, floor, has_lift, city_slug, district_slug = zip(*filas)
+    scores = puntuar_columnas(
+        [o or "rent" for o in operation], district, price, size, floor, has_lift, _referencias,
+        city_slug=city_slug, district_slug=district_slug, umbrales=_umbrales,
+    )
+    mappings = [{"propertyCode": codigo} for codigo in codigos]
+    for campo, valores in scores.items():
+        for m, v in zip(mappings, valores.tolist()):
+            m[campo] = None if v != v else v  # NaN -> NULL
+    return mappings
+
+
+def leer_trozos(desde, tamano):
+    """
+    Genera trozos de filas ordenados por propertyCode a partir de `desde`.
+    Cada trozo se lee en su propia sesión para no dejar una lectura abierta
+    que bloquee las escrituras en SQLite.
+    """
+    ultimo = desde
+    while True:
+        db = SessionLocal()
+        try:
+            query = db.query(*COLUMNAS).order_by(Propiedad.propertyCode)
+            if ultimo is not None:
+                query = query.filter(Propiedad.propertyCode > ultimo)
+            filas = [tuple(f) for f in query.limit(tamano).all()]
+        finally:
+            db.close()
+        if not filas:
+            return
+        ultimo = filas[-1][0]
+        yield filas
+
+
+def leer_progreso():
+    if not os.path.exists(FICHERO_PROGRESO):
+        return None, 0
+    with open(FICHERO_PROGRESO, encoding="utf-8") as f:
+        datos = json.load(f)
+    return datos["ultimo"], datos["procesadas"]
+
+
+def guardar_progreso(ultimo, procesadas):
+    with open(FICHERO_PROGRESO, "w", encoding="utf-8") as f:
+        json.dump({"ultimo": ultimo, "procesadas": procesadas}, f)
+
+
+def escribir(mappings):
+    db = SessionLocal()
+    try:
+        db.execute(update(Propiedad), mappings)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _en_transaccion(funcion):
+    db = SessionLocal()
+    try:
+        funcion(db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def reconstruir_derivadas():
+    """
+    Heatmap, clusters y estadísticas usan score_intrinseco: se rehacen al final,
+    cada tabla en su propia transacción para que el bloqueo de escritura dure
+    solo lo que tarda en reescribirse esa tabla (el cálculo es lectura).
+    La versión de datos se sube al terminar las tres.
+    """
+    for nombre, reconstruir in (
+        ("heatmap", reconstruir_heatmap),
+        ("clusters", reconstruir_clusters),
+        ("estadísticas", refrescar_estadisticas),
+    ):
+        inicio = time.monotonic()
+        _en_transaccion(reconstruir)
+        print(f"   {nombre} reconstruido en {time.monotonic() - inicio:.1f}s")
+    _en_transaccion(incrementar_version_datos)
+
+
+def rescorar(tamano=5000, workers=None, reanudar=False, modo=SCORING_MODO):
+    init_db()
+    desde, procesadas = leer_progreso() if reanudar else (None, 0)
+    if desde is not None:
+        print(f"↩️  Reanudando tras {desde} ({procesadas} ya recalculadas)")
+
+    db = SessionLocal()
+    try:
+        referencias = cargar_referencias(db)
+        umbrales = None
+        if modo == "zona":
+            refrescar_umbrales(db)
+            db.commit()
+            umbrales = TablaUmbrales(db.query(UmbralZona).all())
+    finally:
+        db.close()
+
+    inicio = time.monotonic()
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(workers, initializer=_iniciar_worker, initargs=(referencias, umbrales)) as pool:
+        # Pocos trozos en vuelo: memoria acotada aunque la tabla sea enorme
+        max_pendientes = 2 * workers
+        pendientes = deque()
+
+        def escribir_siguiente():
+            nonlocal procesadas
+            ultimo, futuro = pendientes.popleft()
+            mappings = futuro.result()
+            escribir(mappings)
+            procesadas += len(mappings)
+            # Los trozos se escriben en orden, así que todo lo anterior a `ultimo` ya está
+            guardar_progreso(ultimo, procesadas)
+            print(f"   {procesadas} recalculadas (hasta {ultimo})")
+
+        for filas in leer_trozos(desde, tamano):
+            pendientes.append((filas[-1][0], pool.submit(puntuar_trozo, filas)))
+            if len(pendientes) >= max_pendientes:
+                escribir_siguiente()
+        while pendientes:
+            escribir_siguiente()
+
+    reconstruir_derivadas()
+    if os.path.exists(FICHERO_PROGRESO):
+        os.remove(FICHERO_PROGRESO)
+    print(f"\n🎯 {procesadas} anuncios recalculados en {time.monotonic() - inicio:.1f}s\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recalcula los scores de toda la tabla propiedades")
+    parser.add_argument("--trozo", type=int, default=5000, help="Filas por trozo")
+    parser.add_argument("--workers", type=int, default=None, help="Procesos (por defecto, nº de CPUs)")
+    parser.add_argument("--reanudar", action="store_true", help="Continúa desde el último trozo escrito")
+    parser.add_argument("--modo", choices=MODOS_SCORING, default=SCORING_MODO,
+                        help="Umbrales fijos de Madrid o calculados por zona")
+    args = parser.parse_args()
+
+    rescorar(tamano=args.trozo, workers=args.workers, reanudar=args.reanudar, modo=args.modo)
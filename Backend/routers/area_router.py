@@ -0,0 +1,92 @@
+import numpy as np
+from fastapi import APIRouter, Query, Depends, HTTPException
+from sqlalchemy.orm import Session
+from typing import Optional
+
+from database import get_db
+from models import Propiedad
+from services.formato_mapa import FORMATO_PATTERN, opciones_formato, serializar_propiedades
+from services.geo import bbox_radio, distancias_km
+from services.indice_espacial import obtener_indice
+
+router = APIRouter(prefix="/buscar-area", tags=["buscar-area"])
+
+# Máximo de códigos por cada IN (...) al cargar las filas
+LOTE_IN = 500
+
+
+@router.get("")
+def buscar_area(
+    operation: Optional[str] = Query(None, pattern="^(rent|sale)$"),
+    min_lat: Optional[float] = Query(None, ge=-90, le=90),
+    max_lat: Optional[float] = Query(None, ge=-90, le=90),
+    min_lon: Optional[float] = Query(None, ge=-180, le=180),
+    max_lon: Optional[float] = Query(None, ge=-180, le=180),
+    lat: Optional[float] = Query(None, ge=-90, le=90, description="Centro (con lon y radio_km)"),
+    lon: Optional[float] = Query(None, ge=-180, le=180),
+    radio_km: Optional[float] = Query(None, gt=0, le=50),
+    limite: int = Query(1000, ge=1, le=5000),
+    formato: str = Query("completo", pattern=FORMATO_PATTERN),
+    db: Session = Depends(get_db),
+):
+    """
+    Propiedades dentro del viewport (min_lat/max_lat/min_lon/max_lon) o a
+    menos de radio_km de (lat, lon).
+
+    Los candidatos salen del índice espacial en memoria (rejilla), así que
+    solo se miran las celdas cercanas. En modo radio se filtra después con
+    haversine exacta y se ordena por distancia.
+    """
+    es_bbox = None not in (min_lat, max_lat, min_lon, max_lon)
+    es_radio = None not in (lat, lon, radio_km)
+    if es_bbox == es_radio:
+        raise HTTPException(
+            status_code=400,
+            detail="Indica un bounding box (min_lat, max_lat, min_lon, max_lon) o lat+lon+radio_km",
+        )
+
+    if es_radio:
+        min_lat, max_lat, min_lon, max_lon = bbox_radio(lat, lon, radio_km)
+    elif min_lat > max_lat or min_lon > max_lon:
+        raise HTTPException(status_code=400, detail="Bounding box inválido")
+
+    candidatos = obtener_indice(db).en_bbox(min_lat, max_lat, min_lon, max_lon, operation)
+
+    distancias = {}
+    if es_radio:
+        dist = distancias_km(lat, lon, [c[1] for c in candidatos], [c[2] for c in candidatos])
+        dentro = [(float(dist[i]), candidatos[i][0]) for i in np.flatnonzero(dist <= radio_km)]
+        dentro.sort()
+        codigos = [codigo for _, codigo in dentro]
+        distancias = {codigo: round(d, 3) for d, codigo in dentro}
+    else:
+        codigos = sorted(c[0] for c in candidatos)
+
+    total = len(codigos)
+    codigos = codigos[:limite]
+
+    # Cargar solo las filas que se devuelven, por lotes de IN (...)
+    por_codigo = {}
+    for i in range(0, len(codigos), LOTE_IN):
+        lote = codigos[i:i + LOTE_IN]
+        query = opciones_formato(db.query(Propiedad), formato).filter(Propiedad.propertyCode.in_(lote))
+        for p in query.all():
+            por_codigo[p.propertyCode] = p
+    props = [por_codigo[c] for c in codigos if c in por_codigo]
+
+    respuesta = {
+        "operation": operation,
+        "total": total,
+        "limite": limite,
+        **serializar_propiedades(props, formato),
+    }
+    if es_radio:
+        respuesta["centro"] = {"lat": lat, "lon": lon, "radio_km": radio_km}
+        distancias_lista = [distancias[p.propertyCode] for p in props]
+        if formato == "columnas":
+            respuesta["columnas"]["distancia_km"] = distancias_lista
+        else:
+            for fila, d in zip(respuesta["propiedades"], distancias_lista):
+                fila["distancia_km"] = d
+
+    return respuesta
@@ -0,0 +1,67 @@
+from fastapi import APIRouter, Query, Depends, Request
+from sqlalchemy.orm import Session
+from typing import List, Dict, Any, Optional
+
+from database import get_db
+from models import ClusterMapa
+from services.cache import respuesta_cacheada
+from services.clusters import ZOOM_MAX, celda_cluster
+
+router = APIRouter(prefix="/clusters", tags=["clusters"])
+
+
+@router.get("")
+def get_clusters(
+    request: Request,
+    operation: str = Query("rent", pattern="^(rent|sale)$"),
+    zoom: int = Query(..., ge=0, le=22),
+    min_lat: Optional[float] = Query(None, description="Bounding box (opcional)"),
+    max_lat: Optional[float] = Query(None),
+    min_lon: Optional[float] = Query(None),
+    max_lon: Optional[float] = Query(None),
+    db: Session = Depends(get_db),
+):
+    """
+    Clusters de marcadores para el zoom del mapa:
+    - lat, lon: centroide de los pisos del cluster
+    - count: nº de pisos
+    - precio_medio, score_medio
+
+    Salen de clusters_mapa, que la ingesta mantiene al día; con bounding box
+    solo se leen las celdas visibles. Zooms mayores que ZOOM_MAX usan ZOOM_MAX.
+    """
+    def calcular():
+        z = min(zoom, ZOOM_MAX)
+
+        q = (
+            db.query(ClusterMapa)
+            .filter(ClusterMapa.operation == operation)
+            .filter(ClusterMapa.zoom == z)
+        )
+        if None not in (min_lat, max_lat, min_lon, max_lon):
+            # En Mercator la y crece hacia el sur
+            x0, y0 = celda_cluster(z, max_lat, min_lon)
+            x1, y1 = celda_cluster(z, min_lat, max_lon)
+            q = q.filter(
+                ClusterMapa.celda_x.between(x0, x1),
+                ClusterMapa.celda_y.between(y0, y1),
+            )
+
+        result: List[Dict[str, Any]] = [
+            {
+                "lat": c.suma_lat / c.count,
+                "lon": c.suma_lon / c.count,
+                "count": c.count,
+                "precio_medio": c.suma_precio / c.n_precio if c.n_precio else 0,
+                "score_medio": c.suma_score / c.n_score if c.n_score else 0,
+            }
+            for c in q.all()
+        ]
+
+        return {
+            "operation": operation,
+            "zoom": z,
+            "clusters": result,
+        }
+
+    return respuesta_cacheada(request, db, calcular)
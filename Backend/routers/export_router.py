@@ -0,0 +1,64 @@
+import json
+from typing import Optional
+
+from fastapi import APIRouter, Query
+from fastapi.responses import StreamingResponse
+
+from database import SessionLocal
+from models import Propiedad
+
+router = APIRouter(prefix="/exportar", tags=["exportar"])
+
+# Filas que se piden a la BD en cada vuelta del cursor
+CHUNK_SIZE = 1000
+
+
+def _iterar_propiedades(operation: Optional[str]):
+    """
+    Recorre la tabla propiedades con yield_per para no cargarla entera.
+    Es un volcado completo: incluye los anuncios dados de baja (campo activo).
+    La sesión se abre aquí (y no con Depends) porque el generador se sigue
+    consumiendo mientras se envía la respuesta.
+    """
+    db = SessionLocal()
+    try:
+        query = db.query(Propiedad)
+        if operation:
+            query = query.filter(Propiedad.operation == operation)
+
+        for p in query.order_by(Propiedad.propertyCode).yield_per(CHUNK_SIZE):
+            yield p.as_dict()
+    finally:
+        db.close()
+
+
+def _ndjson(operation: Optional[str]):
+    for fila in _iterar_propiedades(operation):
+        yield json.dumps(fila, ensure_ascii=False) + "\n"
+
+
+def _json_array(operation: Optional[str]):
+    yield "["
+    primero = True
+    for fila in _iterar_propiedades(operation):
+        yield ("" if primero else ",") + json.dumps(fila, ensure_ascii=False)
+        primero = False
+    yield "]"
+
+
+@router.get("")
+def exportar_propiedades(
+    operation: Optional[str] = Query(None, pattern="^(rent|sale)$"),
+    formato: str = Query("ndjson", pattern="^(ndjson|json)$"),
+):
+    """
+    Exporta el catálogo completo en streaming:
+    - ndjson: una propiedad (as_dict) por línea.
+    - json: un único array JSON enviado por trozos.
+
+    La memoria del servidor se mantiene constante y el cliente recibe
+    las primeras filas en cuanto se leen de la BD.
+    """
+    if formato == "ndjson":
+        return StreamingResponse(_ndjson(operation), media_type="application/x-ndjson")
+    return StreamingResponse(_json_array(operation), media_type="application/json")
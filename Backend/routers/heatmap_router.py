@@ -1,18 +1,25 @@
-from fastapi import APIRouter, Query, Depends
-from sqlalchemy import func
+from fastapi import APIRouter, Query, Depends, Request
+from math import floor
 from sqlalchemy.orm import Session
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 from database import get_db
-from models import Propiedad
+from models import HeatmapCelda
+from services.cache import respuesta_cacheada
+from services.heatmap_tiles import NIVELES_HEATMAP, nivel_mas_cercano
 
 router = APIRouter(prefix="/heatmap", tags=["heatmap"])
 
 @router.get("")
 def get_heatmap(
+    request: Request,
     operation: str = Query("rent", pattern="^(rent|sale)$"),
     cell_size: float = Query(0.01, gt=0.0001, le=1.0),
     min_count: int = Query(1, ge=1),
+    min_lat: Optional[float] = Query(None, description="Bounding box (opcional)"),
+    max_lat: Optional[float] = Query(None),
+    min_lon: Optional[float] = Query(None),
+    max_lon: Optional[float] = Query(None),
     db: Session = Depends(get_db),   # ✅ usa la sesión del dependency
 ):
     """
@@ -20,39 +27,50 @@ def get_heatmap(
     - lat, lon: centro de la celda
     - count: nº de pisos
     - avg_score: score_intrinseco medio (0..100)
+
+    Las celdas salen de la pirámide precalculada en heatmap_celdas: cell_size
+    se ajusta al nivel más cercano (el usado se devuelve en cell_size) y, si
+    llega bounding box, solo se leen las celdas visibles.
+
+    La respuesta se cachea hasta que la ingesta cambie la versión de datos.
     """
-    lat_bucket = func.floor(Propiedad.latitude / cell_size)
-    lon_bucket = func.floor(Propiedad.longitude / cell_size)
-
-    q = (
-        db.query(
-            (lat_bucket * cell_size + (cell_size / 2.0)).label("lat_center"),
-            (lon_bucket * cell_size + (cell_size / 2.0)).label("lon_center"),
-            func.count(Propiedad.propertyCode).label("count"),
-            func.avg(func.coalesce(Propiedad.score_intrinseco, 50.0)).label("avg_score"),
+    def calcular():
+        nivel = nivel_mas_cercano(cell_size)
+        tamano = NIVELES_HEATMAP[nivel]
+
+        q = (
+            db.query(HeatmapCelda)
+            .filter(HeatmapCelda.operation == operation)
+            .filter(HeatmapCelda.nivel == nivel)
+            .filter(HeatmapCelda.count >= min_count)
         )
-        .filter(Propiedad.operation == operation)
-        .filter(Propiedad.latitude.isnot(None))
-        .filter(Propiedad.longitude.isnot(None))
-        .group_by(lat_bucket, lon_bucket)
-        .having(func.count(Propiedad.propertyCode) >= min_count)
-    )
-
-    rows = q.all()
-
-    result: List[Dict[str, Any]] = [
-        {
-            "lat": float(r.lat_center),
-            "lon": float(r.lon_center),
-            "count": int(r.count),
-            "avg_score": float(r.avg_score),
+        if min_lat is not None:
+            q = q.filter(HeatmapCelda.celda_lat >= floor(min_lat / tamano))
+        if max_lat is not None:
+            q = q.filter(HeatmapCelda.celda_lat <= floor(max_lat / tamano))
+        if min_lon is not None:
+            q = q.filter(HeatmapCelda.celda_lon >= floor(min_lon / tamano))
+        if max_lon is not None:
+            q = q.filter(HeatmapCelda.celda_lon <= floor(max_lon / tamano))
+
+        rows = q.all()
+
+        result: List[Dict[str, Any]] = [
+            {
+                "lat": r.celda_lat * tamano + tamano / 2.0,
+                "lon": r.celda_lon * tamano + tamano / 2.0,
+                "count": r.count,
+                "avg_score": r.suma_score / r.count,
+            }
+            for r in rows
+        ]
+
+        return {
+            "operation": operation,
+            "cell_size": tamano,
+            "cell_size_solicitado": cell_size,
+            "min_count": min_count,
+            "heatmap": result,
         }
-        for r in rows
-    ]
-
-    return {
-        "operation": operation,
-        "cell_size": cell_size,
-        "min_count": min_count,
-        "heatmap": result,
-    }
+
+    return respuesta_cacheada(request, db, calcular)
@@ -0,0 +1,44 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+
+from database import get_db
+from models import EjecucionIngesta
+from services import programador as programador_ingesta
+
+router = APIRouter(prefix="/ingesta", tags=["ingesta"])
+
+
+@router.get("/estado")
+def estado_ingesta(db: Session = Depends(get_db)):
+    """
+    Estado de la ingesta automática y datos de la última ejecución
+    (de update_all.py o del programador): duración, filas escritas y
+    llamadas a Idealista. `errores` lista las búsquedas que fallaron (una
+    ejecución con todas fallidas no escribe filas pero sí aparece aquí).
+    """
+    ultima = db.query(EjecucionIngesta).order_by(EjecucionIngesta.id.desc()).first()
+
+    ejecucion = None
+    if ultima:
+        ejecucion = {
+            "id": ultima.id,
+            "modo": ultima.modo,
+            "inicio": ultima.inicio.isoformat() if ultima.inicio else None,
+            "fin": ultima.fin.isoformat() if ultima.fin else None,
+            "duracion_s": round((ultima.fin - ultima.inicio).total_seconds(), 1)
+            if ultima.fin and ultima.inicio else None,
+            "filas_escritas": (ultima.nuevas or 0) + (ultima.actualizadas or 0),
+            "nuevas": ultima.nuevas,
+            "actualizadas": ultima.actualizadas,
+            "sin_cambios": ultima.sin_cambios,
+            "inactivadas": ultima.inactivadas,
+            "llamadas": ultima.llamadas,
+            "error": ultima.error,
+            "errores": ultima.error.splitlines() if ultima.error else [],
+        }
+
+    p = programador_ingesta.programador
+    return {
+        "programador": p.estado() if p else {"activo": False},
+        "ultima_ejecucion": ejecucion,
+    }
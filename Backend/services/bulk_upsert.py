@@ -0,0 +1,55 @@
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import Propiedad
+
+# Filas por sentencia INSERT (y códigos por IN) para no pasar el límite de
+# variables de SQLite (32766 desde 3.32)
+TAMANO_LOTE = 500
+
+_DIALECTOS = {
+    "sqlite": sqlite.insert,
+    "postgresql": postgresql.insert,
+}
+
+
+def prefetch_existentes(db, codigos, columnas):
+    """propertyCode -> fila (solo `columnas`) para los códigos que ya están en la BD, en lotes de IN."""
+    codigos = list(codigos)
+    existentes = {}
+    for i in range(0, len(codigos), TAMANO_LOTE):
+        lote = codigos[i:i + TAMANO_LOTE]
+        filas = (
+            db.query(Propiedad.propertyCode, *columnas)
+            .filter(Propiedad.propertyCode.in_(lote))
+            .all()
+        )
+        for fila in filas:
+            existentes[fila.propertyCode] = fila
+    return existentes
+
+
+def upsert_propiedades(db, payloads):
+    """
+    Inserta o actualiza `payloads` (dicts con las columnas de Propiedad)
+    con INSERT ... ON CONFLICT (propertyCode) DO UPDATE por lotes.
+    En dialectos sin ON CONFLICT se cae a session.merge fila a fila.
+    """
+    if not payloads:
+        return
+
+    insert = _DIALECTOS.get(db.get_bind().dialect.name)
+    if insert is None:
+        for payload in payloads:
+            db.merge(Propiedad(**payload))
+        return
+
+    # Todas las filas del lote deben tener las mismas claves
+    columnas = sorted({k for p in payloads for k in p})
+    filas = [{c: p.get(c) for c in columnas} for p in payloads]
+
+    for i in range(0, len(filas), TAMANO_LOTE):
+        stmt = insert(Propiedad).values(filas[i:i + TAMANO_LOTE])
+        # fecha_obtencion es la primera vez que se vio el anuncio: no se pisa
+        actualizar = {c: stmt.excluded[c] for c in columnas if c not in ("propertyCode", "fecha_obtencion")}
+        stmt = stmt.on_conflict_do_update(index_elements=["propertyCode"], set_=actualizar)
+        db.execute(stmt)
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+from models import VersionDatos
+
+CACHE_MAX_ENTRADAS = int(os.getenv("CACHE_MAX_ENTRADAS", "256"))
+CACHE_TTL_SEGUNDOS = float(os.getenv("CACHE_TTL_SEGUNDOS", "3600"))
+
+
+class CacheBackend(ABC):
+    """
+    Interfaz mínima de la caché de respuestas. Para compartirla entre
+    procesos basta con implementar get/set/clear sobre otro almacén (Redis,
+    memcached...) y pasarlo a configurar_cache().
+    """
+
+    @abstractmethod
+    def get(self, clave):
+        ...
+
+    @abstractmethod
+    def set(self, clave, valor):
+        ...
+
+    @abstractmethod
+    def clear(self):
+        ...
+
+
+class CacheLRU(CacheBackend):
+    """Caché en memoria del proceso, LRU con caducidad por TTL."""
+
+    def __init__(self, max_entradas=CACHE_MAX_ENTRADAS, ttl=CACHE_TTL_SEGUNDOS):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, clave):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return None
+            caduca, valor = entrada
+            if caduca < time.monotonic():
+                del self._datos[clave]
+                return None
+            self._datos.move_to_end(clave)
+            return valor
+
+    def set(self, clave, valor):
+        with self._lock:
+            self._datos[clave] = (time.monotonic() + self.ttl, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._datos.clear()
+
+
+_backend = CacheLRU()
+
+
+def configurar_cache(backend: CacheBackend):
+    """Sustituye el backend de la caché (p. ej. por uno compartido)."""
+    global _backend
+    _backend = backend
+
+
+def version_datos(db):
+    fila = db.get(VersionDatos, 1)
+    return fila.version if fila else 0
+
+
+def incrementar_version_datos(db):
+    """Marca que los datos han cambiado (sin hacer commit)."""
+    fila = db.get(VersionDatos, 1)
+    if fila is None:
+        db.add(VersionDatos(id=1, version=1))
+    else:
+        fila.version = (fila.version or 0) + 1
+
+
+def respuesta_cacheada(request: Request, db, calcular):
+    """
+    Devuelve la respuesta JSON de `calcular()` cacheada por ruta + query params
+    normalizados + versión de datos, con ETag y soporte de If-None-Match (304).
+    """
+    # urlencode escapa '&' y '=' dentro de los valores: un único parámetro
+    # con "a&b=c" no puede dar la misma clave que dos parámetros distintos
+    params = urlencode(sorted(request.query_params.multi_items()))
+    clave = f"{request.url.path}?{params}@v{version_datos(db)}"
+    etag = 'W/"' + hashlib.sha1(clave.encode()).hexdigest()[:20] + '"'
+    cabeceras = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [e.strip() for e in if_none_match.split(",")]:
+        return Response(status_code=304, headers=cabeceras)
+
+    cuerpo = _backend.get(clave)
+    if cuerpo is None:
+        cuerpo = json.dumps(jsonable_encoder(calcular()), ensure_ascii=False).encode()
+        _backend.set(clave, cuerpo)
+
+    return Response(content=cuerpo, media_type="application/json", headers=cabeceras)
@@ -0,0 +1,80 @@
+"""
+Captura de respuestas de Idealista en disco y reproducción sin red.
+
+Cada página de /search se guarda tal cual (su elementList) en un fichero
+JSONL comprimido con gzip: <zona>_<operation>_p<página>.jsonl.gz, un anuncio
+por línea. Al terminar la búsqueda se guarda <zona>_<operation>.meta.json con
+el círculo buscado (center, distance en metros) y si se leyeron todas las
+páginas. `update_all.py --replay DIR` vuelve a pasar esas páginas por
+guardar_elementos sin gastar cuota, para medir y ajustar la ingesta.
+"""
+import glob
+import gzip
+import json
+import os
+import re
+
+_NOMBRE = re.compile(r"^(?P<zona>.+)_(?P<operation>[a-z]+)_p(?P<pagina>\d+)\.jsonl\.gz$")
+
+
+def ruta_pagina(directorio, zona, operation, pagina):
+    return os.path.join(directorio, f"{zona}_{operation}_p{pagina:03d}.jsonl.gz")
+
+
+def guardar_pagina(directorio, zona, operation, pagina, datos):
+    """Escribe el elementList de una página en su fichero .jsonl.gz."""
+    os.makedirs(directorio, exist_ok=True)
+    with gzip.open(ruta_pagina(directorio, zona, operation, pagina), "wt", encoding="utf-8") as f:
+        for elemento in datos.get("elementList", []):
+            f.write(json.dumps(elemento, ensure_ascii=False))
+            f.write("\n")
+
+
+def ruta_metadatos(directorio, zona, operation):
+    return os.path.join(directorio, f"{zona}_{operation}.meta.json")
+
+
+def guardar_metadatos(directorio, zona, operation, center, distance, completa):
+    """Círculo buscado y si la búsqueda fue completa; no hace nada si no se captura."""
+    if not directorio:
+        return
+    os.makedirs(directorio, exist_ok=True)
+    with open(ruta_metadatos(directorio, zona, operation), "w", encoding="utf-8") as f:
+        json.dump({"center": center, "distance": distance, "completa": bool(completa)}, f)
+
+
+def capturador(directorio, zona, operation):
+    """Callback al_recibir_pagina(pagina, datos) para los clientes de Idealista; None si no se captura."""
+    if not directorio:
+        return None
+    return lambda pagina, datos: guardar_pagina(directorio, zona, operation, pagina, datos)
+
+
+def capturas_disponibles(directorio):
+    """Parejas (zona, operation) con alguna página capturada en `directorio`."""
+    parejas = set()
+    for ruta in glob.glob(os.path.join(glob.escape(directorio), "*.jsonl.gz")):
+        m = _NOMBRE.match(os.path.basename(ruta))
+        if m:
+            parejas.add((m["zona"], m["operation"]))
+    return sorted(parejas)
+
+
+def leer_capturas(directorio, zona, operation):
+    """
+    Respuesta equivalente a search_by_area a partir de las páginas capturadas,
+    con center/distance de los metadatos. Sin metadatos (capturas antiguas)
+    la búsqueda no cuenta como completa.
+    """
+    elementos = []
+    rutas = sorted(glob.glob(os.path.join(glob.escape(directorio), f"{glob.escape(zona)}_{operation}_p*.jsonl.gz")))
+    for ruta in rutas:
+        with gzip.open(ruta, "rt", encoding="utf-8") as f:
+            elementos.extend(json.loads(linea) for linea in f if linea.strip())
+
+    datos = {"elementList": elementos, "total": len(elementos), "completa": False}
+    ruta_meta = ruta_metadatos(directorio, zona, operation)
+    if os.path.exists(ruta_meta):
+        with open(ruta_meta, encoding="utf-8") as f:
+            datos.update(json.load(f))
+    return datos
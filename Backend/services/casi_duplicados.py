@@ -0,0 +1,181 @@
+"""
+Detección de casi-duplicados: el mismo piso publicado por varias agencias
+con el precio algo distinto, el tamaño redondeado o la dirección escrita de
+otra forma. La huella MD5 (generar_huella_digital) solo ve copias exactas.
+
+Para no comparar todos contra todos:
+- Bloqueo: solo se comparan anuncios de la misma operación y nº de
+  habitaciones en celdas vecinas de ~100 m.
+- SimHash de 64 bits sobre trigramas de la dirección normalizada: dos
+  direcciones parecidas dan huellas a poca distancia de Hamming.
+- Tolerancia en precio y tamaño.
+Los bloques son pequeños, así que el coste es casi lineal en filas.
+"""
+import hashlib
+import re
+
+from sqlalchemy.orm import load_only
+
+from models import Propiedad
+from services.normalizacion import slug_ubicacion
+
+CELDA_GRADOS = 0.001          # ~110 m en latitud
+MAX_HAMMING = 10              # de 64 bits
+TOLERANCIA_PRECIO = 0.05      # 5 %
+TOLERANCIA_TAMANO = 0.05      # 5 % ...
+TOLERANCIA_TAMANO_M2 = 3      # ... o 3 m²
+
+_NO_ALFANUM = re.compile(r"[^a-z0-9]+")
+# Palabras que cambian entre portales sin cambiar la dirección
+_VACIAS = {
+    "calle", "c", "cl", "avenida", "avda", "av", "plaza", "pza", "pl", "paseo", "po",
+    "de", "del", "la", "las", "el", "los", "y", "n", "no", "num", "s", "sn",
+}
+
+
+def tokens_direccion(address):
+    """'C/ de Alcalá, nº 123' -> ['alcala', '123']"""
+    texto = _NO_ALFANUM.sub(" ", slug_ubicacion(address))
+    return [t for t in texto.split() if t not in _VACIAS]
+
+
+def simhash(tokens):
+    """SimHash de 64 bits sobre los trigramas de caracteres de los tokens."""
+    texto = " ".join(tokens)
+    if not texto:
+        return None
+    shingles = {texto[i:i + 3] for i in range(max(1, len(texto) - 2))}
+    pesos = [0] * 64
+    for s in shingles:
+        h = int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "big")
+        for bit in range(64):
+            pesos[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit in range(64) if pesos[bit] > 0)
+
+
+def _cerca(a, b, tolerancia, absoluta=0):
+    if not a or not b:
+        return a == b
+    return abs(a - b) <= max(tolerancia * max(a, b), absoluta)
+
+
+def _numeros(tokens):
+    return {t for t in tokens if t.isdigit()}
+
+
+def son_casi_duplicados(a, b):
+    """a y b son dicts con price, size, floor, numeros y simhash."""
+    # Distinta planta o distinto número de portal: pisos distintos del mismo edificio/calle
+    if a["floor"] and b["floor"] and a["floor"] != b["floor"]:
+        return False
+    if a["numeros"] and b["numeros"] and a["numeros"] != b["numeros"]:
+        return False
+    if not _cerca(a["price"], b["price"], TOLERANCIA_PRECIO):
+        return False
+    if not _cerca(a["size"], b["size"], TOLERANCIA_TAMANO, TOLERANCIA_TAMANO_M2):
+        return False
+    if a["simhash"] is None or b["simhash"] is None:
+        # Sin dirección en alguno: basta con la misma celda, precio y tamaño
+        return True
+    return bin(a["simhash"] ^ b["simhash"]).count("1") <= MAX_HAMMING
+
+
+def agrupar_casi_duplicados(pisos):
+    """
+    pisos: dicts con propertyCode, operation, latitude, longitude, rooms,
+    price, size, floor y address. Devuelve propertyCode -> propertyCode
+    original para los que son casi-duplicado de otro. El original de cada
+    grupo es el primero en el orden de entrada.
+    """
+    bloques = {}
+    datos = {}
+    orden = {}
+    for i, p in enumerate(pisos):
+        if p.get("latitude") is None or p.get("longitude") is None:
+            continue
+        tokens = tokens_direccion(p.get("address"))
+        p = {
+            **p,
+            "floor": (p.get("floor") or "").strip().lower(),
+            "numeros": _numeros(tokens),
+            "simhash": simhash(tokens),
+        }
+        datos[p["propertyCode"]] = p
+        orden[p["propertyCode"]] = i
+        celda = (int(p["latitude"] // CELDA_GRADOS), int(p["longitude"] // CELDA_GRADOS))
+        bloques.setdefault((p["operation"], p.get("rooms") or 0, celda), []).append(p)
+
+    # Union-find; la raíz de cada grupo es el de menor posición de entrada
+    padre = {}
+
+    def raiz(c):
+        while padre.get(c, c) != c:
+            padre[c] = padre.get(padre[c], padre[c])
+            c = padre[c]
+        return c
+
+    def unir(a, b):
+        ra, rb = raiz(a), raiz(b)
+        # Los originales también tienen que parecerse, para no encadenar
+        # 1250 € ~ 1200 € ~ 1150 € en un solo grupo
+        if ra != rb and son_casi_duplicados(datos[ra], datos[rb]):
+            if orden[rb] < orden[ra]:
+                ra, rb = rb, ra
+            padre[rb] = ra
+
+    for (operation, rooms, (cy, cx)), miembros in bloques.items():
+        # Celdas vecinas "hacia delante" para no comparar dos veces cada par
+        vecinos = [
+            v
+            for dy, dx in ((0, 1), (1, -1), (1, 0), (1, 1))
+            for v in bloques.get((operation, rooms, (cy + dy, cx + dx)), [])
+        ]
+        for i, a in enumerate(miembros):
+            for b in miembros[i + 1:] + vecinos:
+                if son_casi_duplicados(a, b):
+                    unir(a["propertyCode"], b["propertyCode"])
+
+    return {c: raiz(c) for c in orden if raiz(c) != c}
+
+
+def marcar_casi_duplicados(db):
+    """
+    Recorre toda la tabla propiedades y rellena casi_duplicado_de. Las copias
+    exactas (es_duplicado, que calcula la ingesta por huella) se dejan fuera.
+    Devuelve el nº de anuncios marcados.
+    """
+    filas = (
+        db.query(Propiedad)
+        .options(load_only(
+            Propiedad.propertyCode, Propiedad.operation, Propiedad.latitude,
+            Propiedad.longitude, Propiedad.rooms, Propiedad.price, Propiedad.size,
+            Propiedad.floor, Propiedad.address, Propiedad.es_duplicado, Propiedad.casi_duplicado_de,
+        ))
+        .order_by(Propiedad.fecha_obtencion, Propiedad.propertyCode)
+        .all()
+    )
+
+    candidatos = [p for p in filas if not p.es_duplicado]
+    originales = agrupar_casi_duplicados([
+        {
+            "propertyCode": p.propertyCode,
+            "operation": p.operation,
+            "latitude": p.latitude,
+            "longitude": p.longitude,
+            "rooms": p.rooms,
+            "price": p.price,
+            "size": p.size,
+            "floor": p.floor,
+            "address": p.address,
+        }
+        for p in candidatos
+    ])
+
+    cambios = [
+        {"propertyCode": p.propertyCode, "casi_duplicado_de": originales.get(p.propertyCode)}
+        for p in filas
+        if p.casi_duplicado_de != originales.get(p.propertyCode)
+    ]
+    if cambios:
+        db.bulk_update_mappings(Propiedad, cambios)
+    return len(originales)
@@ -0,0 +1,99 @@
+from collections import defaultdict
+from math import floor, log, pi, radians, tan, cos
+
+from models import ClusterMapa, Propiedad
+
+# Zooms precalculados (por encima de ZOOM_MAX se usa ZOOM_MAX)
+ZOOM_MAX = 16
+# Celdas por tesela de 256 px en cada eje: 2 -> clusters de ~128 px
+CELDAS_POR_TESELA = 2
+
+_CAMPOS = ("count", "suma_lat", "suma_lon", "suma_precio", "n_precio", "suma_score", "n_score")
+
+
+def mercator(lat, lon):
+    """Coordenadas Web Mercator normalizadas a [0, 1)."""
+    lat = max(min(lat, 85.0511), -85.0511)
+    x = (lon + 180.0) / 360.0
+    y = (1.0 - log(tan(radians(lat)) + 1.0 / cos(radians(lat))) / pi) / 2.0
+    return x, y
+
+
+def celda_cluster(zoom, lat, lon):
+    n = (2 ** zoom) * CELDAS_POR_TESELA
+    x, y = mercator(lat, lon)
+    return floor(x * n), floor(y * n)
+
+
+def punto_cluster(operation, lat, lon, price, score):
+    """Clave de una propiedad para los clusters, o None si no tiene coordenadas."""
+    if not operation or lat is None or lon is None:
+        return None
+    return (operation, lat, lon, price, score)
+
+
+def nuevos_deltas_cluster():
+    return defaultdict(lambda: [0, 0.0, 0.0, 0.0, 0, 0.0, 0])
+
+
+def registrar_cambio_cluster(deltas, antes, despues):
+    """Acumula en `deltas` (clave de celda -> sumas) el cambio de un punto en todos los zooms."""
+    if antes == despues:
+        return
+    for punto, signo in ((antes, -1), (despues, 1)):
+        if punto is None:
+            continue
+        operation, lat, lon, price, score = punto
+        x, y = mercator(lat, lon)
+        for zoom in range(ZOOM_MAX + 1):
+            n = (2 ** zoom) * CELDAS_POR_TESELA
+            d = deltas[(operation, zoom, floor(x * n), floor(y * n))]
+            d[0] += signo
+            d[1] += signo * lat
+            d[2] += signo * lon
+            if price is not None:
+                d[3] += signo * price
+                d[4] += signo
+            if score is not None:
+                d[5] += signo * score
+                d[6] += signo
+
+
+def aplicar_deltas_cluster(db, deltas):
+    """Suma los deltas a clusters_mapa y borra los clusters vacíos (sin commit)."""
+    for (operation, zoom, cx, cy), d in deltas.items():
+        if not any(d):
+            continue
+        cluster = db.get(ClusterMapa, (operation, zoom, cx, cy))
+        if cluster is None:
+            if d[0] <= 0:
+                continue
+            cluster = ClusterMapa(operation=operation, zoom=zoom, celda_x=cx, celda_y=cy)
+            for campo in _CAMPOS:
+                setattr(cluster, campo, 0)
+            db.add(cluster)
+        for campo, valor in zip(_CAMPOS, d):
+            setattr(cluster, campo, getattr(cluster, campo) + valor)
+        if cluster.count <= 0:
+            db.delete(cluster)
+
+
+def reconstruir_clusters(db):
+    """Recalcula todos los clusters recorriendo propiedades por trozos (sin commit)."""
+    deltas = nuevos_deltas_cluster()
+    filas = db.query(
+        Propiedad.operation,
+        Propiedad.latitude,
+        Propiedad.longitude,
+        Propiedad.price,
+        Propiedad.score_intrinseco,
+    ).filter(Propiedad.activo.isnot(False)).yield_per(1000)
+    for operation, lat, lon, price, score in filas:
+        registrar_cambio_cluster(deltas, None, punto_cluster(operation, lat, lon, price, score))
+
+    # Todo lo anterior es lectura: el bloqueo de escritura empieza en el DELETE
+    db.query(ClusterMapa).delete()
+    db.bulk_insert_mappings(ClusterMapa, [
+        {"operation": operation, "zoom": zoom, "celda_x": cx, "celda_y": cy, **dict(zip(_CAMPOS, d))}
+        for (operation, zoom, cx, cy), d in deltas.items()
+    ])
@@ -0,0 +1,85 @@
+"""
+t-digest (variante "merging") para estimar cuantiles en una sola pasada y
+con memoria acotada: guarda como mucho ~`compresion` centroides aunque se le
+pasen millones de valores, con más resolución en las colas (p10, p90).
+"""
+from math import asin, pi, sin
+
+
+class TDigest:
+    def __init__(self, compresion=100):
+        self.compresion = compresion
+        self.medias = []
+        self.pesos = []
+        self.buffer = []
+        self.n = 0
+        self.minimo = None
+        self.maximo = None
+
+    def agregar(self, valor):
+        self.buffer.append(float(valor))
+        self.n += 1
+        if self.minimo is None or valor < self.minimo:
+            self.minimo = valor
+        if self.maximo is None or valor > self.maximo:
+            self.maximo = valor
+        if len(self.buffer) >= 5 * self.compresion:
+            self._comprimir()
+
+    def _k(self, q):
+        # Función de escala k1: centroides pequeños cerca de q=0 y q=1
+        return self.compresion / (2 * pi) * asin(2 * q - 1)
+
+    def _q(self, k):
+        return (sin(k * 2 * pi / self.compresion) + 1) / 2
+
+    def _comprimir(self):
+        if not self.buffer:
+            return
+        puntos = sorted(
+            list(zip(self.medias, self.pesos)) + [(v, 1.0) for v in self.buffer]
+        )
+        self.buffer = []
+        total = sum(p for _, p in puntos)
+
+        medias, pesos = [], []
+        media, peso = puntos[0]
+        acumulado = 0.0
+        limite = total * self._q(self._k(0.0) + 1)
+        for m, p in puntos[1:]:
+            if acumulado + peso + p <= limite:
+                media += (m - media) * p / (peso + p)
+                peso += p
+            else:
+                medias.append(media)
+                pesos.append(peso)
+                acumulado += peso
+                limite = total * self._q(self._k(acumulado / total) + 1)
+                media, peso = m, p
+        medias.append(media)
+        pesos.append(peso)
+        self.medias, self.pesos = medias, pesos
+
+    def cuantil(self, q):
+        """Cuantil q (0-1) interpolando entre centroides; None si está vacío."""
+        self._comprimir()
+        if not self.medias:
+            return None
+        if len(self.medias) == 1:
+            return self.medias[0]
+
+        objetivo = q * self.n
+        # Centro acumulado de cada centroide, con min y max en los extremos
+        centros = [(0.0, self.minimo)]
+        acumulado = 0.0
+        for m, p in zip(self.medias, self.pesos):
+            centros.append((acumulado + p / 2, m))
+            acumulado += p
+        centros.append((float(self.n), self.maximo))
+
+        for (c0, m0), (c1, m1) in zip(centros, centros[1:]):
+            if objetivo <= c1:
+                if c1 == c0:
+                    return m1
+                return m0 + (m1 - m0) * (objetivo - c0) / (c1 - c0)
+        return self.maximo
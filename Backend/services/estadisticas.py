@@ -0,0 +1,58 @@
+from datetime import datetime
+
+from sqlalchemy import func
+
+from models import EstadisticaDistrito, Propiedad
+
+# Misma agrupación que usaba /estadisticas-globales en Python
+ZONA_EXPR = func.coalesce(func.nullif(func.trim(Propiedad.district), ""), "Desconocido")
+OPERATION_EXPR = func.coalesce(func.nullif(func.trim(Propiedad.operation), ""), "desconocido")
+
+
+def zona_de(district):
+    """Nombre de zona con el que se agrupa un distrito."""
+    return (district or "").strip() or "Desconocido"
+
+
+def refrescar_estadisticas(db, zonas=None):
+    """
+    Recalcula las filas de estadisticas_distrito de `zonas` (o de todas si es
+    None) con un GROUP BY en SQL. No hace commit; hay que llamarlo después de
+    un flush para que vea los cambios de la ingesta.
+    """
+    query = db.query(
+        ZONA_EXPR.label("zona"),
+        OPERATION_EXPR.label("operation"),
+        func.count(Propiedad.propertyCode),
+        func.avg(Propiedad.price),
+        func.avg(Propiedad.size),
+        func.avg(Propiedad.score_intrinseco),
+        func.min(Propiedad.price),
+        func.max(Propiedad.price),
+    ).filter(Propiedad.activo.isnot(False))
+    borrado = db.query(EstadisticaDistrito)
+    if zonas is not None:
+        zonas = list(zonas)
+        if not zonas:
+            return
+        query = query.filter(ZONA_EXPR.in_(zonas))
+        borrado = borrado.filter(EstadisticaDistrito.zona.in_(zonas))
+
+    filas = query.group_by(ZONA_EXPR, OPERATION_EXPR).all()
+
+    borrado.delete(synchronize_session=False)
+    ahora = datetime.now()
+    for zona, operation, count, precio, tamano, score, precio_min, precio_max in filas:
+        db.add(
+            EstadisticaDistrito(
+                zona=zona,
+                operation=operation,
+                count=count,
+                precio_medio=precio or 0,
+                tamano_medio=tamano or 0,
+                score_medio=score or 0,
+                precio_min=precio_min or 0,
+                precio_max=precio_max or 0,
+                actualizado_en=ahora,
+            )
+        )
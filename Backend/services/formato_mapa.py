@@ -0,0 +1,43 @@
+from sqlalchemy.orm import load_only
+
+from models import Propiedad
+
+# Campos que necesita la capa de marcadores del mapa
+CAMPOS_MAPA = (
+    "propertyCode",
+    "operation",
+    "latitude",
+    "longitude",
+    "price",
+    "size",
+    "score_intrinseco",
+)
+
+FORMATO_PATTERN = "^(completo|columnas)$"
+
+
+def opciones_formato(query, formato):
+    """
+    En formato 'columnas' solo se cargan de la BD las columnas del mapa
+    (más score_final, que usa la paginación por cursor para ordenar).
+    """
+    if formato != "columnas":
+        return query
+    columnas = [getattr(Propiedad, c) for c in CAMPOS_MAPA]
+    return query.options(load_only(*columnas, Propiedad.score_final))
+
+
+def serializar_propiedades(props, formato):
+    """
+    Devuelve el fragmento de respuesta con las propiedades:
+    - completo: {"propiedades": [as_dict(), ...]}
+    - columnas: {"columnas": {campo: [valores...]}} orientado a columnas,
+      mucho más pequeño y rápido de serializar para pintar marcadores.
+    """
+    if formato != "columnas":
+        return {"propiedades": [p.as_dict() for p in props]}
+
+    return {
+        "formato": "columnas",
+        "columnas": {c: [getattr(p, c) for p in props] for c in CAMPOS_MAPA},
+    }
@@ -0,0 +1,30 @@
+from math import asin, cos, radians, sin, sqrt
+
+import numpy as np
+
+RADIO_TIERRA_KM = 6371
+
+
+def distancia_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Calcula la distancia entre dos coordenadas (km)."""
+    R = RADIO_TIERRA_KM
+    dlat = radians(lat2 - lat1)
+    dlon = radians(lon2 - lon1)
+    a = sin(dlat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2) ** 2
+    return 2 * R * asin(sqrt(a))
+
+
+def distancias_km(lat0: float, lon0: float, lats, lons):
+    """Haversine de un punto contra muchos a la vez, vectorizada con numpy (array de km)."""
+    lats_r = np.radians(np.asarray(lats, dtype=float))
+    lons_r = np.radians(np.asarray(lons, dtype=float))
+    lat0_r = radians(lat0)
+    a = np.sin((lats_r - lat0_r) / 2) ** 2 + cos(lat0_r) * np.cos(lats_r) * np.sin((lons_r - radians(lon0)) / 2) ** 2
+    return 2 * RADIO_TIERRA_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def bbox_radio(lat: float, lon: float, radio_km: float):
+    """Bounding box (min_lat, max_lat, min_lon, max_lon) que contiene el círculo."""
+    dlat = radio_km / 111.32
+    dlon = radio_km / (111.32 * max(cos(radians(lat)), 1e-6))
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
@@ -0,0 +1,83 @@
+from collections import defaultdict
+from math import floor, log
+
+from models import HeatmapCelda, Propiedad
+
+# Tamaños de celda (grados) de cada nivel de la pirámide. Solo se puede
+# añadir al final: `nivel` en heatmap_celdas es el índice en esta lista.
+NIVELES_HEATMAP = [0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0]
+
+# Score que se asume cuando una propiedad no lo tiene (igual que el heatmap original)
+SCORE_POR_DEFECTO = 50.0
+
+
+def nivel_mas_cercano(cell_size):
+    """Índice del nivel cuyo tamaño está más cerca (en escala logarítmica) de cell_size."""
+    return min(
+        range(len(NIVELES_HEATMAP)),
+        key=lambda i: abs(log(NIVELES_HEATMAP[i] / cell_size)),
+    )
+
+
+def punto_heatmap(operation, lat, lon, score):
+    """Clave de una propiedad para el heatmap, o None si no tiene coordenadas."""
+    if not operation or lat is None or lon is None:
+        return None
+    return (operation, lat, lon, score if score is not None else SCORE_POR_DEFECTO)
+
+
+def registrar_cambio_heatmap(deltas, antes, despues):
+    """Acumula en `deltas` (clave de celda -> [count, suma_score]) el cambio de un punto."""
+    if antes == despues:
+        return
+    for punto, signo in ((antes, -1), (despues, 1)):
+        if punto is None:
+            continue
+        operation, lat, lon, score = punto
+        for nivel, tamano in enumerate(NIVELES_HEATMAP):
+            d = deltas[(operation, nivel, floor(lat / tamano), floor(lon / tamano))]
+            d[0] += signo
+            d[1] += signo * score
+
+
+def nuevos_deltas_heatmap():
+    return defaultdict(lambda: [0, 0.0])
+
+
+def aplicar_deltas_heatmap(db, deltas):
+    """Suma los deltas a heatmap_celdas y borra las celdas que quedan vacías (sin commit)."""
+    for (operation, nivel, i, j), (dcount, dsuma) in deltas.items():
+        if not dcount and not dsuma:
+            continue
+        celda = db.get(HeatmapCelda, (operation, nivel, i, j))
+        if celda is None:
+            if dcount <= 0:
+                continue
+            celda = HeatmapCelda(
+                operation=operation, nivel=nivel, celda_lat=i, celda_lon=j, count=0, suma_score=0.0
+            )
+            db.add(celda)
+        celda.count += dcount
+        celda.suma_score += dsuma
+        if celda.count <= 0:
+            db.delete(celda)
+
+
+def reconstruir_heatmap(db):
+    """Recalcula la pirámide entera recorriendo propiedades por trozos (sin commit)."""
+    deltas = nuevos_deltas_heatmap()
+    filas = db.query(
+        Propiedad.operation,
+        Propiedad.latitude,
+        Propiedad.longitude,
+        Propiedad.score_intrinseco,
+    ).filter(Propiedad.activo.isnot(False)).yield_per(1000)
+    for operation, lat, lon, score in filas:
+        registrar_cambio_heatmap(deltas, None, punto_heatmap(operation, lat, lon, score))
+
+    # Todo lo anterior es lectura: el bloqueo de escritura empieza en el DELETE
+    db.query(HeatmapCelda).delete()
+    db.bulk_insert_mappings(HeatmapCelda, [
+        {"operation": operation, "nivel": nivel, "celda_lat": i, "celda_lon": j, "count": count, "suma_score": suma}
+        for (operation, nivel, i, j), (count, suma) in deltas.items()
+    ])
@@ -1,34 +1,177 @@
 import requests
 import os
+import random
 import time
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Permite apuntar a un servidor mock local para pruebas
+IDEALISTA_BASE_URL = os.getenv("IDEALISTA_BASE_URL", "https://api.idealista.com")
+
+# Reintentos ante 429 / 5xx / errores de red
+MAX_REINTENTOS = 4
+BACKOFF_BASE = 1.0   # segundos
+BACKOFF_MAX = 30.0
+ESTADOS_REINTENTABLES = {429, 500, 502, 503, 504}
+
+# Pausa entre páginas para no ser agresivos con Idealista
+PAUSA_PAGINA = 0.5  # segundos
+
+# Margen para renovar el token antes de que caduque
+MARGEN_TOKEN = 60  # segundos
+
+
+def espera_backoff(intento, retry_after=None):
+    """Backoff exponencial con jitter completo; respeta Retry-After si viene."""
+    if retry_after:
+        try:
+            return min(float(retry_after), BACKOFF_MAX)
+        except ValueError:
+            pass
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** intento))
+
+
 class IdealistaAPI:
     """Cliente para la API de Idealista."""
 
-    def __init__(self):
+    def __init__(self, base_url=IDEALISTA_BASE_URL):
         self.api_key = os.getenv("IDEALISTA_API_KEY")
         self.secret = os.getenv("IDEALISTA_SECRET")
+        self.base_url = base_url.rstrip("/")
         self.token = None
+        self.token_expira = 0.0
+
+        # Sesión persistente: reutiliza conexiones TLS entre páginas y zonas
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+        self.session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+
+        # Métricas por llamada (ver resumen_metricas)
+        self.metricas = {"llamadas": 0, "errores": 0, "reintentos": 0, "renovaciones_token": 0, "latencias": []}
+
+    def _post(self, path, **kwargs):
+        """POST con reintentos (429/5xx/red) y registro de latencia."""
+        url = f"{self.base_url}{path}"
+        for intento in range(MAX_REINTENTOS + 1):
+            inicio = time.perf_counter()
+            try:
+                resp = self.session.post(url, **kwargs)
+            except requests.RequestException:
+                resp = None
+            self.metricas["llamadas"] += 1
+            self.metricas["latencias"].append(time.perf_counter() - inicio)
+
+            if resp is not None and resp.status_code not in ESTADOS_REINTENTABLES:
+                return resp
+            if intento == MAX_REINTENTOS:
+                if resp is None:
+                    self.metricas["errores"] += 1
+                    raise requests.ConnectionError(f"Sin respuesta de {url}")
+                return resp
+
+            self.metricas["reintentos"] += 1
+            retry_after = resp.headers.get("Retry-After") if resp is not None else None
+            time.sleep(espera_backoff(intento, retry_after))
+
+    def resumen_metricas(self):
+        lat = sorted(self.metricas["latencias"])
+        return {
+            "llamadas": self.metricas["llamadas"],
+            "errores": self.metricas["errores"],
+            "reintentos": self.metricas["reintentos"],
+            "renovaciones_token": self.metricas["renovaciones_token"],
+            "latencia_media_ms": round(1000 * sum(lat) / len(lat), 1) if lat else 0,
+            "latencia_p95_ms": round(1000 * lat[int(0.95 * (len(lat) - 1))], 1) if lat else 0,
+        }
 
     def get_access_token(self):
         try:
-            auth = requests.auth.HTTPBasicAuth(self.api_key, self.secret)
-            response = requests.post(
-                "https://api.idealista.com/oauth/token",
+            response = self._post(
+                "/oauth/token",
                 data={"grant_type": "client_credentials"},
-                auth=auth,
-                timeout=10
+                auth=requests.auth.HTTPBasicAuth(self.api_key, self.secret),
+                timeout=10,
             )
             response.raise_for_status()
-            self.token = response.json().get("access_token")
+            data = response.json()
+            self.token = data.get("access_token")
+            self.token_expira = time.monotonic() + float(data.get("expires_in", 3600)) - MARGEN_TOKEN
+            self.metricas["renovaciones_token"] += 1
             return self.token
         except Exception as e:
+            self.metricas["errores"] += 1
             print(f"[Idealista] ❌ Error obteniendo token: {e}")
+            self.token = None
             return None
 
+    def _token_valido(self):
+        if self.token and time.monotonic() < self.token_expira:
+            return self.token
+        return self.get_access_token()
+
+    def _buscar(self, params_base, num_pages, al_recibir_pagina=None):
+        """
+        Recorre las páginas de /search renovando el token si caduca o da 401.
+        `al_recibir_pagina(page, datos)` se llama con cada respuesta (captura).
+        Devuelve (resultados, completa, errores, primera): completa solo si se
+        han leído sin errores todas las páginas hasta totalPages; errores
+        describe la página que falló (la búsqueda se corta en ella) y primera
+        es la respuesta de la página 1 (con total y totalPages de Idealista).
+        """
+        all_results = []
+        completa = False
+        errores = []
+        primera = {}
+        for page in range(1, num_pages + 1):
+            params = {**params_base, "numPage": page}
+            try:
+                if not self._token_valido():
+                    print(f"[Idealista] ⚠️ Sin token en página {page}")
+                    errores.append(f"página {page}: sin token de acceso")
+                    break
+                resp = self._post(
+                    "/3.5/es/search",
+                    headers={"Authorization": f"Bearer {self.token}"},
+                    data=params,
+                    timeout=20,
+                )
+                if resp.status_code == 401:
+                    # Token revocado o caducado antes de lo previsto: renovar y repetir
+                    self.token = None
+                    if not self._token_valido():
+                        errores.append(f"página {page}: no se pudo renovar el token")
+                        break
+                    resp = self._post(
+                        "/3.5/es/search",
+                        headers={"Authorization": f"Bearer {self.token}"},
+                        data=params,
+                        timeout=20,
+                    )
+                resp.raise_for_status()
+                datos = resp.json()
+                if page == 1:
+                    primera = datos
+                if al_recibir_pagina:
+                    al_recibir_pagina(page, datos)
+                batch = datos.get("elementList", [])
+                if not batch:
+                    completa = True
+                    break
+                all_results.extend(batch)
+                total_paginas = datos.get("totalPages")
+                if page >= int(total_paginas or num_pages):
+                    completa = total_paginas is not None
+                    break
+                time.sleep(PAUSA_PAGINA)
+            except Exception as e:
+                self.metricas["errores"] += 1
+                print(f"[Idealista] ⚠️ Error en página {page}: {e}")
+                errores.append(f"página {page}: {e}")
+                break
+        return all_results, completa, errores, primera
+
     def search_by_area(
         self,
         locationId=None,
@@ -38,12 +181,12 @@ class IdealistaAPI:
         property_type="homes",
         max_items=50,
         num_pages=3,
+        al_recibir_pagina=None,
     ):
         """Busca propiedades por coordenadas o locationId."""
-        if not (self.token or self.get_access_token()):
+        if not self._token_valido():
             return {"error": "No se pudo obtener token de acceso"}
 
-        headers = {"Authorization": f"Bearer {self.token}"}
         params_base = {
             "country": "es",
             "operation": operation,
@@ -60,35 +203,19 @@ class IdealistaAPI:
         else:
             return {"error": "Debe indicarse locationId o center+distance"}
 
-        all_results = []
-        for page in range(1, num_pages + 1):
-            params = {**params_base, "numPage": page}
-            try:
-                resp = requests.post(
-                    "https://api.idealista.com/3.5/es/search",
-                    headers=headers,
-                    data=params,
-                    timeout=20,
-                )
-                resp.raise_for_status()
-                batch = resp.json().get("elementList", [])
-                if not batch:
-                    break
-                all_results.extend(batch)
-                time.sleep(0.5)
-            except Exception as e:
-                print(f"[Idealista] ⚠️ Error en página {page}: {e}")
-                break
+        all_results, completa, errores, primera = self._buscar(params_base, num_pages, al_recibir_pagina)
 
-        print(f"[Idealista] ✅ Total resultados obtenidos: {len(all_results)}")
-        return {"elementList": all_results, "total": len(all_results)}
+        print(f"[Idealista] ✅ Total resultados obtenidos: {len(all_results)}"
+              + ("" if completa else " (búsqueda incompleta)"))
+        # total/totalPages son los de Idealista, aunque solo se hayan pedido num_pages
+        return {"elementList": all_results, "total": primera.get("total", len(all_results)),
+                "totalPages": primera.get("totalPages"), "completa": completa, "errores_paginas": errores}
 
     def search_by_area_name(self, area_name, operation="rent", property_type="homes", max_items=50, num_pages=3):
         """Búsqueda por nombre de zona (locationId o texto libre)."""
-        if not (self.token or self.get_access_token()):
+        if not self._token_valido():
             return {"error": "No se pudo obtener token de acceso"}
 
-        headers = {"Authorization": f"Bearer {self.token}"}
         params_base = {
             "country": "es",
             "operation": operation,
@@ -98,25 +225,8 @@ class IdealistaAPI:
             "q": area_name,  # Idealista permite búsqueda textual
         }
 
-        all_results = []
-        for page in range(1, num_pages + 1):
-            params = {**params_base, "numPage": page}
-            try:
-                resp = requests.post(
-                    "https://api.idealista.com/3.5/es/search",
-                    headers=headers,
-                    data=params,
-                    timeout=20,
-                )
-                resp.raise_for_status()
-                batch = resp.json().get("elementList", [])
-                if not batch:
-                    break
-                all_results.extend(batch)
-                time.sleep(0.5)
-            except Exception as e:
-                print(f"[Idealista] ⚠️ Error en página {page}: {e}")
-                break
+        all_results, completa, errores, primera = self._buscar(params_base, num_pages)
 
         print(f"[Idealista] ✅ Resultados obtenidos por nombre '{area_name}': {len(all_results)}")
-        return {"elementList": all_results, "total": len(all_results)}
+        return {"elementList": all_results, "total": primera.get("total", len(all_results)),
+                "totalPages": primera.get("totalPages"), "completa": completa, "errores_paginas": errores}
@@ -0,0 +1,188 @@
+import asyncio
+import os
+import time
+
+import httpx
+from dotenv import load_dotenv
+
+from services.idealista_api import (
+    ESTADOS_REINTENTABLES,
+    IDEALISTA_BASE_URL,
+    MAX_REINTENTOS,
+    espera_backoff,
+)
+
+load_dotenv()
+
+# Cuota de la API: peticiones por segundo y ráfaga máxima
+IDEALISTA_RATE = float(os.getenv("IDEALISTA_RATE", "1.0"))
+IDEALISTA_BURST = int(os.getenv("IDEALISTA_BURST", "2"))
+
+
+class TokenBucket:
+    """Limitador token-bucket para asyncio: `rate` peticiones/s con ráfagas de `capacidad`."""
+
+    def __init__(self, rate, capacidad):
+        self.rate = rate
+        self.capacidad = capacidad
+        self.tokens = float(capacidad)
+        self.ultimo = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                ahora = time.monotonic()
+                self.tokens = min(self.capacidad, self.tokens + (ahora - self.ultimo) * self.rate)
+                self.ultimo = ahora
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class IdealistaAsyncAPI:
+    """
+    Cliente asíncrono de Idealista (httpx) para la ingesta concurrente.
+    Todas las peticiones, incluido el token, pasan por el mismo TokenBucket,
+    así que se pueden lanzar muchas búsquedas a la vez sin pasarse de cuota.
+    """
+
+    def __init__(self, rate=IDEALISTA_RATE, burst=IDEALISTA_BURST, base_url=IDEALISTA_BASE_URL):
+        self.api_key = os.getenv("IDEALISTA_API_KEY")
+        self.secret = os.getenv("IDEALISTA_SECRET")
+        self.base_url = base_url.rstrip("/")
+        self.token = None
+        self.llamadas = 0
+        self.limitador = TokenBucket(rate, burst)
+        self._token_lock = asyncio.Lock()
+        self.client = httpx.AsyncClient(timeout=20)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.client.aclose()
+
+    async def _post(self, path, **kwargs):
+        """POST dentro de la cuota, con los mismos reintentos (429/5xx/red) que IdealistaAPI."""
+        for intento in range(MAX_REINTENTOS + 1):
+            await self.limitador.acquire()
+            self.llamadas += 1
+            try:
+                resp = await self.client.post(f"{self.base_url}{path}", **kwargs)
+            except httpx.TransportError:
+                if intento == MAX_REINTENTOS:
+                    raise
+                await asyncio.sleep(espera_backoff(intento))
+                continue
+
+            if resp.status_code in ESTADOS_REINTENTABLES and intento < MAX_REINTENTOS:
+                await asyncio.sleep(espera_backoff(intento, resp.headers.get("Retry-After")))
+                continue
+            resp.raise_for_status()
+            return resp.json()
+
+    async def get_access_token(self):
+        # Un solo token compartido aunque lo pidan varias tareas a la vez
+        async with self._token_lock:
+            if self.token:
+                return self.token
+            try:
+                data = await self._post(
+                    "/oauth/token",
+                    data={"grant_type": "client_credentials"},
+                    auth=(self.api_key or "", self.secret or ""),
+                )
+                self.token = data.get("access_token")
+            except Exception as e:
+                print(f"[Idealista] ❌ Error obteniendo token: {e}")
+                self.token = None
+            return self.token
+
+    async def _pagina(self, headers, params_base, page, errores):
+        """Una página de /search, o None si falla (el motivo se añade a `errores`)."""
+        try:
+            try:
+                return await self._post(
+                    "/3.5/es/search",
+                    headers=headers,
+                    data={**params_base, "numPage": page},
+                )
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code != 401:
+                    raise
+                # Token caducado: se renueva una vez y se repite la página
+                token_usado = headers["Authorization"].removeprefix("Bearer ")
+                async with self._token_lock:
+                    if self.token == token_usado:
+                        self.token = None
+                if not await self.get_access_token():
+                    raise
+                return await self._post(
+                    "/3.5/es/search",
+                    headers={"Authorization": f"Bearer {self.token}"},
+                    data={**params_base, "numPage": page},
+                )
+        except Exception as e:
+            print(f"[Idealista] ⚠️ Error en página {page}: {e}")
+            errores.append(f"página {page}: {e}")
+            return None
+
+    async def search_by_area(
+        self,
+        center,
+        distance,
+        operation="rent",
+        property_type="homes",
+        max_items=50,
+        num_pages=3,
+        al_recibir_pagina=None,
+    ):
+        """
+        Igual que IdealistaAPI.search_by_area, pero tras la primera página
+        (que indica totalPages) pide el resto en paralelo. `completa` indica si
+        se han leído sin errores todas las páginas hasta totalPages y
+        `errores_paginas` qué páginas fallaron.
+        """
+        if not await self.get_access_token():
+            return {"error": "No se pudo obtener token de acceso"}
+
+        headers = {"Authorization": f"Bearer {self.token}"}
+        params_base = {
+            "country": "es",
+            "operation": operation,
+            "propertyType": property_type,
+            "maxItems": max_items,
+            "locale": "es",
+            "center": center,
+            "distance": distance,
+        }
+
+        errores = []
+        primera = await self._pagina(headers, params_base, 1, errores)
+        if not primera:
+            return {"elementList": [], "total": 0, "completa": False, "errores_paginas": errores}
+
+        if al_recibir_pagina:
+            al_recibir_pagina(1, primera)
+        all_results = list(primera.get("elementList", []))
+        paginas_idealista = int(primera.get("totalPages") or 1)
+        total_pages = min(num_pages, paginas_idealista)
+        completa = paginas_idealista <= num_pages
+
+        resto = await asyncio.gather(
+            *(self._pagina(headers, params_base, p, errores) for p in range(2, total_pages + 1))
+        )
+        for page, datos in enumerate(resto, start=2):
+            if datos:
+                if al_recibir_pagina:
+                    al_recibir_pagina(page, datos)
+                all_results.extend(datos.get("elementList", []))
+            else:
+                completa = False
+
+        print(f"[Idealista] ✅ Total resultados obtenidos ({center}, {operation}): {len(all_results)}"
+              + ("" if completa else " (búsqueda incompleta)"))
+        return {"elementList": all_results, "total": primera.get("total", len(all_results)),
+                "totalPages": primera.get("totalPages"), "completa": completa, "errores_paginas": errores}
@@ -0,0 +1,197 @@
+"""
+Ingesta incremental: detección de cambios por hash de contenido, historial
+de precios y baja de anuncios que dejan de aparecer.
+
+- hash_contenido: MD5 de los campos que vienen de Idealista. Si coincide con
+  el guardado, el anuncio no se reescribe; solo se marca como visto.
+- price_history: una fila por cada cambio de precio.
+- Cada ejecución de update_all.py es una fila de ejecuciones_ingesta, y los
+  círculos que ha buscado enteros (todas las páginas, sin errores) quedan en
+  areas_ejecucion. Un anuncio pasa a activo = False cuando las últimas N
+  ejecuciones que cubrieron su posición no lo han visto.
+"""
+import hashlib
+import json
+from collections import defaultdict
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import func, update
+
+from models import AreaEjecucion, EjecucionIngesta, HistorialPrecio, Propiedad
+from services.bulk_upsert import TAMANO_LOTE
+from services.geo import bbox_radio, distancias_km
+
+# Campos del payload que vienen de Idealista (no los derivados: scores, slugs...)
+CAMPOS_CONTENIDO = (
+    "price", "size", "rooms", "bathrooms", "floor", "address", "district",
+    "neighborhood", "city", "latitude", "longitude", "hasLift", "exterior",
+    "url", "operation",
+)
+
+# Ejecuciones sin aparecer tras las que un anuncio se da de baja
+EJECUCIONES_PARA_INACTIVAR = 3
+
+# Columnas de los anuncios dados de baja: las que hacen falta para quitarlos
+# de ubicaciones, heatmap, clusters y estadísticas
+COLUMNAS_BAJA = (
+    Propiedad.propertyCode,
+    Propiedad.operation,
+    Propiedad.city,
+    Propiedad.district,
+    Propiedad.neighborhood,
+    Propiedad.latitude,
+    Propiedad.longitude,
+    Propiedad.price,
+    Propiedad.score_intrinseco,
+    Propiedad.ultima_ejecucion,
+    Propiedad.fecha_obtencion,
+)
+
+
+def hash_contenido(payload):
+    contenido = [payload.get(c) for c in CAMPOS_CONTENIDO]
+    return hashlib.md5(json.dumps(contenido, default=str).encode()).hexdigest()
+
+
+def registrar_cambios_precio(db, payloads, existentes):
+    """Añade a price_history los anuncios ya guardados cuyo precio ha cambiado."""
+    ahora = datetime.now()
+    cambios = [
+        {
+            "property_code": codigo,
+            "fecha": ahora,
+            "precio_anterior": existentes[codigo].price,
+            "precio": p["price"],
+        }
+        for codigo, p in payloads.items()
+        if codigo in existentes and existentes[codigo].price != p["price"]
+    ]
+    if cambios:
+        db.execute(HistorialPrecio.__table__.insert(), cambios)
+    return len(cambios)
+
+
+def marcar_vistos(db, codigos, ejecucion):
+    """Marca como vistos (y activos) en esta ejecución anuncios que no se reescriben."""
+    codigos = list(codigos)
+    for i in range(0, len(codigos), TAMANO_LOTE):
+        db.execute(
+            update(Propiedad)
+            .where(Propiedad.propertyCode.in_(codigos[i:i + TAMANO_LOTE]))
+            .values(ultima_ejecucion=ejecucion, activo=True)
+            .execution_options(synchronize_session=False)
+        )
+
+
+def iniciar_ejecucion(db, modo):
+    """Crea la fila de ejecuciones_ingesta y devuelve su id (hace commit)."""
+    ejecucion = EjecucionIngesta(modo=modo, inicio=datetime.now())
+    db.add(ejecucion)
+    db.commit()
+    return ejecucion.id
+
+
+def cerrar_ejecucion(db, ejecucion_id, resultados, llamadas=0, inactivadas=0, error=None):
+    """Guarda los totales de la ejecución a partir de los dicts de guardar_elementos (hace commit)."""
+    ejecucion = db.get(EjecucionIngesta, ejecucion_id)
+    ejecucion.fin = datetime.now()
+    ejecucion.llamadas = llamadas
+    ejecucion.nuevas = sum(r.get("nuevas", 0) for r in resultados)
+    ejecucion.actualizadas = sum(r.get("actualizadas", 0) for r in resultados)
+    ejecucion.sin_cambios = sum(r.get("sin_cambios", 0) for r in resultados)
+    ejecucion.inactivadas = inactivadas
+    ejecucion.error = error
+    db.commit()
+
+
+def registrar_areas(db, ejecucion_id, areas):
+    """Guarda en areas_ejecucion los círculos (operation, lat, lon, radio_km) buscados enteros (sin commit)."""
+    db.add_all(
+        AreaEjecucion(ejecucion_id=ejecucion_id, operation=operation, latitude=lat, longitude=lon, radio_km=radio_km)
+        for operation, lat, lon, radio_km in areas
+    )
+
+
+def _dentro(areas, operation, lat, lon):
+    """Máscara de los puntos que caen en alguno de los círculos de `areas`."""
+    mascara = np.zeros(len(lat), dtype=bool)
+    for area_op, area_lat, area_lon, radio_km in areas:
+        mascara |= (operation == area_op) & (distancias_km(area_lat, area_lon, lat, lon) <= radio_km)
+    return mascara
+
+
+def marcar_inactivas(db, ejecucion_id, areas, n=EJECUCIONES_PARA_INACTIVAR):
+    """
+    Da de baja los anuncios activos dentro de `areas` (círculos buscados
+    enteros en esta ejecución, ya guardados con registrar_areas) que no han
+    aparecido en ninguna de las últimas `n` ejecuciones que cubrieron su
+    posición. Solo cuentan las ejecuciones posteriores a la primera vez que
+    se vio el anuncio. Devuelve las filas dadas de baja (COLUMNAS_BAJA).
+    """
+    if not areas:
+        return []
+
+    # Candidatos: activos, no vistos en esta ejecución y a menos de radio_km (haversine)
+    candidatos = {}
+    for operation, lat, lon, radio_km in areas:
+        min_lat, max_lat, min_lon, max_lon = bbox_radio(lat, lon, radio_km)
+        filas = (
+            db.query(*COLUMNAS_BAJA)
+            .filter(
+                Propiedad.operation == operation,
+                Propiedad.latitude.between(min_lat, max_lat),
+                Propiedad.longitude.between(min_lon, max_lon),
+                Propiedad.activo.isnot(False),
+                func.coalesce(Propiedad.ultima_ejecucion, 0) < ejecucion_id,
+            )
+            .all()
+        )
+        if not filas:
+            continue
+        distancias = distancias_km(lat, lon, [f.latitude for f in filas], [f.longitude for f in filas])
+        candidatos.update((f.propertyCode, f) for f, d in zip(filas, distancias) if d <= radio_km)
+    if not candidatos:
+        return []
+
+    filas = list(candidatos.values())
+    operation = np.array([f.operation for f in filas], dtype=object)
+    lat = np.array([f.latitude for f in filas], dtype=float)
+    lon = np.array([f.longitude for f in filas], dtype=float)
+    visto = np.array([f.ultima_ejecucion or 0 for f in filas])
+    alta = np.array([f.fecha_obtencion or datetime.min for f in filas], dtype="datetime64[us]")
+
+    # Ejecuciones que han cubierto algún candidato después de la última vez que se vio
+    previas = (
+        db.query(AreaEjecucion, EjecucionIngesta.inicio)
+        .join(EjecucionIngesta, EjecucionIngesta.id == AreaEjecucion.ejecucion_id)
+        .filter(
+            AreaEjecucion.operation.in_(set(operation.tolist())),
+            AreaEjecucion.ejecucion_id > int(visto.min()),
+        )
+        .all()
+    )
+    por_ejecucion = defaultdict(list)
+    inicios = {}
+    for area, inicio in previas:
+        por_ejecucion[area.ejecucion_id].append((area.operation, area.latitude, area.longitude, area.radio_km))
+        inicios[area.ejecucion_id] = inicio
+
+    sin_ver = np.zeros(len(filas), dtype=int)
+    for ejecucion, areas_previas in por_ejecucion.items():
+        sin_ver += (
+            _dentro(areas_previas, operation, lat, lon)
+            & (visto < ejecucion)
+            & (alta < np.datetime64(inicios[ejecucion] or datetime.min, "us"))
+        )
+
+    bajas = [f for f, k in zip(filas, sin_ver) if k >= n]
+    codigos = [f.propertyCode for f in bajas]
+    for i in range(0, len(codigos), TAMANO_LOTE):
+        db.execute(
+            update(Propiedad)
+            .where(Propiedad.propertyCode.in_(codigos[i:i + TAMANO_LOTE]))
+            .values(activo=False)
+            .execution_options(synchronize_session=False)
+        )
+    return bajas
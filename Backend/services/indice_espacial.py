@@ -0,0 +1,89 @@
+import threading
+from collections import defaultdict
+from math import floor
+
+from models import Propiedad
+from services.cache import version_datos
+
+# Tamaño de celda de la rejilla en grados (~1 km en Madrid)
+TAMANO_CELDA = 0.01
+
+
+class IndiceEspacial:
+    """
+    Rejilla en memoria (celda -> puntos) con las coordenadas de todas las
+    propiedades, separada por operación. Solo guarda (propertyCode, lat, lon),
+    así que cabe en memoria incluso con cientos de miles de anuncios.
+    """
+
+    def __init__(self, tamano=TAMANO_CELDA):
+        self.tamano = tamano
+        self.celdas = defaultdict(lambda: defaultdict(list))
+        self.total = 0
+
+    def _celda(self, lat, lon):
+        return floor(lat / self.tamano), floor(lon / self.tamano)
+
+    def agregar(self, operation, codigo, lat, lon):
+        self.celdas[operation][self._celda(lat, lon)].append((codigo, lat, lon))
+        self.total += 1
+
+    def en_bbox(self, min_lat, max_lat, min_lon, max_lon, operation=None):
+        """
+        Puntos (codigo, lat, lon) dentro del rectángulo. Si el rectángulo abarca
+        más celdas de las que hay ocupadas, se recorren las ocupadas en vez del
+        rango completo (un bbox enorme no cuesta más que leer todo el índice).
+        """
+        i0, j0 = self._celda(min_lat, min_lon)
+        i1, j1 = self._celda(max_lat, max_lon)
+        n_rango = (i1 - i0 + 1) * (j1 - j0 + 1)
+        operaciones = [operation] if operation else list(self.celdas)
+
+        resultado = []
+        for op in operaciones:
+            rejilla = self.celdas.get(op)
+            if not rejilla:
+                continue
+            if n_rango > len(rejilla):
+                celdas = (
+                    puntos for (i, j), puntos in rejilla.items()
+                    if i0 <= i <= i1 and j0 <= j <= j1
+                )
+            else:
+                celdas = (
+                    rejilla.get((i, j), ()) for i in range(i0, i1 + 1) for j in range(j0, j1 + 1)
+                )
+            for puntos in celdas:
+                for codigo, lat, lon in puntos:
+                    if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon:
+                        resultado.append((codigo, lat, lon))
+        return resultado
+
+_indice = None
+_version = None
+_lock = threading.Lock()
+
+
+def obtener_indice(db):
+    """
+    Devuelve el índice espacial, reconstruyéndolo solo cuando la ingesta
+    ha cambiado la versión de datos desde la última vez.
+    """
+    global _indice, _version
+    version = version_datos(db)
+    with _lock:
+        if _indice is None or _version != version:
+            indice = IndiceEspacial()
+            filas = (
+                db.query(Propiedad.operation, Propiedad.propertyCode, Propiedad.latitude, Propiedad.longitude)
+                .filter(
+                    Propiedad.latitude.isnot(None),
+                    Propiedad.longitude.isnot(None),
+                    Propiedad.activo.isnot(False),
+                )
+                .yield_per(5000)
+            )
+            for operation, codigo, lat, lon in filas:
+                indice.agregar(operation, codigo, lat, lon)
+            _indice, _version = indice, version
+        return _indice
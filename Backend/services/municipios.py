@@ -0,0 +1,78 @@
+"""
+Corrección del municipio que devuelve Idealista a partir de una tabla de
+configuración (config/municipios.json) en vez de una cadena de if/elif.
+
+Todos los patrones se compilan una sola vez en una expresión regular con
+alternativas; para cada texto se busca una vez y, si aparecen varios
+patrones, gana el de menor posición en la tabla (igual que el if/elif).
+Para añadir municipios basta con editar el JSON (o apuntar
+MUNICIPIOS_CONFIG a otro fichero).
+"""
+import json
+import os
+import re
+
+from services.normalizacion import slug_ubicacion
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUTA_CONFIG = os.getenv("MUNICIPIOS_CONFIG", os.path.join(BASE_DIR, "config", "municipios.json"))
+
+
+class NormalizadorMunicipios:
+    def __init__(self, correcciones, aplica_a=("madrid",)):
+        """correcciones: lista de (patrón, municipio) por orden de prioridad."""
+        self.aplica_a = {slug_ubicacion(c) for c in aplica_a}
+        self.prioridad = {}
+        self.municipios = {}
+        for i, (patron, municipio) in enumerate(correcciones):
+            patron = slug_ubicacion(patron)
+            self.prioridad.setdefault(patron, i)
+            self.municipios.setdefault(patron, municipio)
+        self.regex = re.compile("|".join(re.escape(p) for p in self.prioridad)) if self.prioridad else None
+        self._cache = {}
+
+    @classmethod
+    def desde_fichero(cls, ruta=RUTA_CONFIG):
+        with open(ruta, encoding="utf-8") as f:
+            config = json.load(f)
+        return cls(
+            [(c["patron"], c["municipio"]) for c in config["correcciones"]],
+            config.get("aplica_a", ["madrid"]),
+        )
+
+    def municipio(self, city, district, neighborhood):
+        """
+        Municipio corregido (o `city` tal cual si no aplica ninguna corrección).
+        Se memoriza por (city, district, neighborhood): se repiten mucho.
+        """
+        clave = (city, district, neighborhood)
+        resultado = self._cache.get(clave)
+        if resultado is None:
+            resultado = self._cache[clave] = self._corregir(city or "", district or "", neighborhood or "")
+        return resultado
+
+    def _corregir(self, city, district, neighborhood):
+        if self.regex is None or slug_ubicacion(city) not in self.aplica_a:
+            return city
+        encontrados = [m.group(0) for m in self.regex.finditer(slug_ubicacion(f"{district} {neighborhood}"))]
+        if not encontrados:
+            return city
+        return self.municipios[min(encontrados, key=self.prioridad.__getitem__)]
+
+    def normalizar_pagina(self, elementos):
+        """Municipio corregido de cada elemento de un elementList de Idealista."""
+        return [
+            self.municipio(e.get("municipality"), e.get("district"), e.get("neighborhood"))
+            for e in elementos
+        ]
+
+
+_normalizador = None
+
+
+def obtener_normalizador():
+    """Normalizador compilado a partir de RUTA_CONFIG (se carga una vez por proceso)."""
+    global _normalizador
+    if _normalizador is None:
+        _normalizador = NormalizadorMunicipios.desde_fichero()
+    return _normalizador
@@ -0,0 +1,18 @@
+import re
+import unicodedata
+
+_ESPACIOS = re.compile(r"\s+")
+
+
+def slug_ubicacion(texto):
+    """
+    Normaliza un nombre de municipio/distrito/barrio para búsquedas exactas:
+    sin tildes, en minúsculas y con los espacios colapsados.
+    'Pozuelo de  Alarcón ' -> 'pozuelo de alarcon'
+    """
+    if not texto:
+        return ""
+    sin_tildes = "".join(
+        c for c in unicodedata.normalize("NFKD", texto) if not unicodedata.combining(c)
+    )
+    return _ESPACIOS.sub(" ", sin_tildes).strip().lower()
@@ -0,0 +1,103 @@
+import base64
+import json
+
+from fastapi import HTTPException
+from sqlalchemy import and_, func, or_
+
+from models import Propiedad
+
+# Órdenes admitidos en modo cursor: nombre -> (expresión, descendente)
+# Los NULL se sustituyen por un valor fijo para que la comparación por
+# tuplas sea total y ninguna fila se pierda entre páginas.
+ORDENES = {
+    "propertyCode": (None, False),
+    "price": (func.coalesce(Propiedad.price, 0.0), False),
+    "-price": (func.coalesce(Propiedad.price, 0.0), True),
+    "score": (func.coalesce(Propiedad.score_final, Propiedad.score_intrinseco, 0.0), False),
+    "-score": (func.coalesce(Propiedad.score_final, Propiedad.score_intrinseco, 0.0), True),
+}
+
+
+def codificar_cursor(orden, fila):
+    """Genera el cursor opaco que apunta justo después de `fila`."""
+    expr, _ = ORDENES[orden]
+    clave = [fila.propertyCode]
+    if expr is not None:
+        clave.insert(0, valor_orden(orden, fila))
+    raw = json.dumps({"o": orden, "k": clave}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor, orden):
+    """Devuelve la clave guardada en el cursor o lanza 400 si no es válido."""
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(cursor + padding))
+        clave = data["k"]
+        cursor_orden = data["o"]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+    if cursor_orden != orden:
+        raise HTTPException(status_code=400, detail="El cursor no corresponde al orden solicitado")
+
+    # propertyCode -> [código]; resto de órdenes -> [valor numérico, código]
+    expr, _ = ORDENES[orden]
+    longitud = 1 if expr is None else 2
+    if (
+        not isinstance(clave, list)
+        or len(clave) != longitud
+        or not isinstance(clave[-1], str)
+        or (longitud == 2 and (isinstance(clave[0], bool) or not isinstance(clave[0], (int, float))))
+    ):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return clave
+
+
+def valor_orden(orden, fila):
+    """Replica en Python el valor de ordenación que usa SQL para una fila."""
+    if orden in ("price", "-price"):
+        return fila.price if fila.price is not None else 0.0
+    if orden in ("score", "-score"):
+        for v in (fila.score_final, fila.score_intrinseco):
+            if v is not None:
+                return v
+        return 0.0
+    return fila.propertyCode
+
+
+def paginar_por_cursor(query, orden, cursor, per_page):
+    """
+    Aplica paginación keyset a `query` ordenando por `orden` + propertyCode.
+
+    Devuelve (filas, next_cursor). Se pide una fila de más para saber si
+    existe página siguiente sin necesidad de hacer un COUNT.
+    """
+    if orden not in ORDENES:
+        raise HTTPException(status_code=400, detail=f"Orden no soportado: {orden}")
+
+    expr, descendente = ORDENES[orden]
+    codigo = Propiedad.propertyCode
+
+    if cursor:
+        clave = decodificar_cursor(cursor, orden)
+        if expr is None:
+            query = query.filter(codigo > clave[0])
+        else:
+            valor, ultimo_codigo = clave
+            mas_alla = expr < valor if descendente else expr > valor
+            query = query.filter(or_(mas_alla, and_(expr == valor, codigo > ultimo_codigo)))
+
+    if expr is None:
+        query = query.order_by(codigo)
+    else:
+        query = query.order_by(expr.desc() if descendente else expr, codigo)
+
+    filas = query.limit(per_page + 1).all()
+
+    next_cursor = None
+    if len(filas) > per_page:
+        filas = filas[:per_page]
+        next_cursor = codificar_cursor(orden, filas[-1])
+
+    return filas, next_cursor
@@ -0,0 +1,165 @@
+"""
+Planificador de búsquedas sobre una rejilla de la Comunidad de Madrid.
+
+En vez de los círculos fijos de CENTROS (que se solapan y dejan zonas sin
+cubrir), la región se divide en celdas cuadradas de CELDA_KM. Para cada celda
+y operación se estima cuántos anuncios nuevos saldrían si se buscase ahora:
+
+- densidad: anuncios guardados en la celda, o el total que dio Idealista en
+  su última búsqueda (o DENSIDAD_INICIAL si nunca se ha buscado y no hay datos).
+- antigüedad: días desde la última vez que se vieron sus anuncios, ya sea en
+  una búsqueda del planificador o en cualquier otra ingesta (EDAD_MAX si nunca).
+- nuevos esperados = densidad * (1 - (1 - TASA_ROTACION) ** antigüedad),
+  sin pasar de lo que cabe en las páginas que se van a pedir.
+
+El plan coge las celdas con más anuncios nuevos esperados por llamada hasta
+agotar la cuota diaria. Cada búsqueda hecha se registra en
+celdas_planificador para la siguiente planificación.
+"""
+import os
+from datetime import datetime
+from math import ceil, cos, radians, sqrt
+
+from sqlalchemy import Integer, cast, func
+
+from models import CeldaPlanificador, EjecucionIngesta, Propiedad
+
+# Bounding box de la Comunidad de Madrid
+LAT_MIN, LAT_MAX = 39.88, 41.17
+LON_MIN, LON_MAX = -4.58, -3.05
+
+CELDA_KM = 3.0
+ELEMENTOS_POR_PAGINA = 50
+MAX_PAGINAS = 3
+
+IDEALISTA_CUOTA_DIARIA = int(os.getenv("IDEALISTA_CUOTA_DIARIA", "100"))
+
+TASA_ROTACION = 0.03    # fracción de anuncios de una celda que cambia cada día
+EDAD_MAX = 30           # días que se suponen para celdas nunca buscadas
+DENSIDAD_INICIAL = 2    # anuncios supuestos en celdas sin ningún dato
+
+# Tamaño de celda en grados (a la latitud media de la región)
+DLAT = CELDA_KM / 111.32
+DLON = CELDA_KM / (111.32 * cos(radians((LAT_MIN + LAT_MAX) / 2)))
+
+
+def centro_celda(celda_lat, celda_lon):
+    return LAT_MIN + (celda_lat + 0.5) * DLAT, LON_MIN + (celda_lon + 0.5) * DLON
+
+
+def radio_celda_m():
+    """Radio del círculo que cubre la celda entera."""
+    return round(CELDA_KM * sqrt(2) / 2 * 1000)
+
+
+def todas_las_celdas():
+    filas = ceil((LAT_MAX - LAT_MIN) / DLAT)
+    columnas = ceil((LON_MAX - LON_MIN) / DLON)
+    return [(i, j) for i in range(filas) for j in range(columnas)]
+
+
+def densidad_por_celda(db):
+    """
+    (operation, celda_lat, celda_lon) -> (anuncios guardados, última vez que
+    se vieron), con un GROUP BY en SQL. La última vez es la más reciente entre
+    fecha_actualizacion y el inicio de la última ejecución que los vio (en
+    modo incremental los anuncios sin cambios no se reescriben).
+    """
+    celda_lat = cast((Propiedad.latitude - LAT_MIN) / DLAT, Integer)
+    celda_lon = cast((Propiedad.longitude - LON_MIN) / DLON, Integer)
+    filas = (
+        db.query(
+            Propiedad.operation, celda_lat, celda_lon, func.count(Propiedad.propertyCode),
+            func.max(Propiedad.fecha_actualizacion), func.max(Propiedad.ultima_ejecucion),
+        )
+        .filter(
+            Propiedad.latitude.between(LAT_MIN, LAT_MAX),
+            Propiedad.longitude.between(LON_MIN, LON_MAX),
+        )
+        .group_by(Propiedad.operation, celda_lat, celda_lon)
+        .all()
+    )
+    ids = {ejecucion for *_, ejecucion in filas if ejecucion}
+    inicios = dict(
+        db.query(EjecucionIngesta.id, EjecucionIngesta.inicio).filter(EjecucionIngesta.id.in_(ids))
+    ) if ids else {}
+
+    densidades = {}
+    for op, i, j, n, actualizada, ejecucion in filas:
+        fechas = [f for f in (actualizada, inicios.get(ejecucion)) if f is not None]
+        densidades[(op, i, j)] = (n, max(fechas) if fechas else None)
+    return densidades
+
+
+def estimar(densidad, historial, ahora, vista=None):
+    """
+    (páginas, nuevos esperados) de buscar ahora una celda. `vista` es la
+    última vez que se vieron sus anuncios en la BD (densidad_por_celda).
+    """
+    if historial is not None and historial.ultima_busqueda is not None:
+        densidad = max(densidad, historial.vistos)
+        vista = max(vista, historial.ultima_busqueda) if vista else historial.ultima_busqueda
+    else:
+        densidad = densidad or DENSIDAD_INICIAL
+    edad = (ahora - vista).total_seconds() / 86400 if vista else EDAD_MAX
+
+    paginas = min(MAX_PAGINAS, max(1, ceil(densidad / ELEMENTOS_POR_PAGINA)))
+    esperados = densidad * (1 - (1 - TASA_ROTACION) ** min(edad, EDAD_MAX))
+    return paginas, min(esperados, paginas * ELEMENTOS_POR_PAGINA)
+
+
+def planificar(db, operaciones, cuota=IDEALISTA_CUOTA_DIARIA):
+    """
+    Lista de búsquedas (dicts con operation, celda, center, distance, paginas
+    y nuevos_esperados) ordenadas por rendimiento, dentro de `cuota` llamadas.
+    Se reserva una llamada para el token.
+    """
+    ahora = datetime.now()
+    densidades = densidad_por_celda(db)
+    historial = {
+        (h.operation, h.celda_lat, h.celda_lon): h
+        for h in db.query(CeldaPlanificador).filter(CeldaPlanificador.operation.in_(list(operaciones)))
+    }
+
+    candidatas = []
+    for operation in operaciones:
+        for i, j in todas_las_celdas():
+            clave = (operation, i, j)
+            densidad, vista = densidades.get(clave, (0, None))
+            paginas, esperados = estimar(densidad, historial.get(clave), ahora, vista)
+            if esperados > 0:
+                candidatas.append((esperados / paginas, clave, paginas, esperados))
+    candidatas.sort(reverse=True)
+
+    plan = []
+    restantes = cuota - 1
+    for rendimiento, (operation, i, j), paginas, esperados in candidatas:
+        if paginas > restantes:
+            continue
+        lat, lon = centro_celda(i, j)
+        plan.append({
+            "operation": operation,
+            "celda": (i, j),
+            "center": f"{lat:.4f},{lon:.4f}",
+            "distance": radio_celda_m(),
+            "paginas": paginas,
+            "nuevos_esperados": round(esperados, 1),
+        })
+        restantes -= paginas
+        if restantes <= 0:
+            break
+    return plan
+
+
+def registrar_busqueda(db, operation, celda, llamadas, vistos, nuevas):
+    """Anota en celdas_planificador el resultado de buscar una celda (sin commit)."""
+    i, j = celda
+    fila = db.get(CeldaPlanificador, (operation, i, j))
+    if fila is None:
+        fila = CeldaPlanificador(operation=operation, celda_lat=i, celda_lon=j, busquedas=0, llamadas=0)
+        db.add(fila)
+    fila.ultima_busqueda = datetime.now()
+    fila.busquedas += 1
+    fila.llamadas += llamadas
+    fila.vistos = vistos
+    fila.nuevas = nuevas
@@ -0,0 +1,113 @@
+"""
+Programador de la ingesta dentro del propio proceso de la API.
+
+Si INGESTA_AUTOMATICA=1, on_startup arranca un hilo que cada
+INGESTA_INTERVALO_MIN minutos lanza la ingesta incremental de update_all.py
+(por ZONAS o con el planificador de celdas, según INGESTA_MODO). Corre en su
+propio hilo, así que no bloquea el bucle de eventos que atiende las
+peticiones. El resultado de cada ejecución queda en ejecuciones_ingesta y
+se consulta en /ingesta/estado.
+
+Las bajas de anuncios que dejan de aparecer solo se calculan con búsquedas
+completas: los círculos de ZONAS superan las páginas que se piden, así que
+para que funcionen hace falta INGESTA_MODO=planificada.
+"""
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+MODOS_INGESTA = ("zonas", "planificada")
+
+INGESTA_AUTOMATICA = os.getenv("INGESTA_AUTOMATICA", "0") == "1"
+INGESTA_INTERVALO_MIN = float(os.getenv("INGESTA_INTERVALO_MIN", "360"))
+INGESTA_MODO = os.getenv("INGESTA_MODO", "zonas")
+
+
+class ProgramadorIngesta:
+    def __init__(self, intervalo_min=INGESTA_INTERVALO_MIN, modo=INGESTA_MODO):
+        if modo not in MODOS_INGESTA:
+            raise ValueError(f"INGESTA_MODO debe ser uno de {MODOS_INGESTA}, no '{modo}'")
+        self.intervalo = intervalo_min * 60
+        self.modo = modo
+        self.en_curso = False
+        self.proxima = None
+        self.ultimo_error = None
+        self.ejecuciones = 0
+        self._parar = threading.Event()
+        self._lock = threading.Lock()
+        self._hilo = None
+
+    def iniciar(self):
+        if self._hilo and self._hilo.is_alive():
+            return
+        self._parar.clear()
+        self._hilo = threading.Thread(target=self._bucle, name="programador-ingesta", daemon=True)
+        self._hilo.start()
+        print(f"⏰ Ingesta automática cada {self.intervalo / 60:g} min (modo {self.modo})")
+
+    def detener(self):
+        self._parar.set()
+
+    def _bucle(self):
+        # La primera ejecución espera un intervalo: reiniciar la API no gasta cuota
+        while True:
+            self.proxima = datetime.now() + timedelta(seconds=self.intervalo)
+            if self._parar.wait(self.intervalo):
+                return
+            self.ejecutar()
+
+    def ejecutar(self):
+        """Lanza una ingesta incremental ahora (no se solapan dos)."""
+        if not self._lock.acquire(blocking=False):
+            return False
+        self.en_curso = True
+        inicio = time.monotonic()
+        try:
+            # Import diferido: update_all arrastra los clientes de Idealista
+            import update_all
+
+            # Devuelven los errores de las búsquedas que fallaron (None si ninguna)
+            if self.modo == "planificada":
+                self.ultimo_error = update_all.main_planificado(incremental=True)
+            else:
+                self.ultimo_error = update_all.main(incremental=True)
+        except Exception as e:
+            self.ultimo_error = str(e)
+            print(f"❌ Error en la ingesta automática: {e}")
+        finally:
+            self.ejecuciones += 1
+            self.en_curso = False
+            self._lock.release()
+            print(f"⏰ Ingesta automática terminada en {time.monotonic() - inicio:.1f}s")
+        return True
+
+    def estado(self):
+        return {
+            "activo": bool(self._hilo and self._hilo.is_alive()),
+            "modo": self.modo,
+            "intervalo_min": self.intervalo / 60,
+            "en_curso": self.en_curso,
+            "proxima_ejecucion": self.proxima.isoformat() if self.proxima and not self._parar.is_set() else None,
+            "ejecuciones": self.ejecuciones,
+            "ultimo_error": self.ultimo_error,
+        }
+
+
+programador = None
+
+
+def iniciar_programador():
+    """Arranca el programador si INGESTA_AUTOMATICA=1 (lo llama on_startup)."""
+    global programador
+    if not INGESTA_AUTOMATICA:
+        return None
+    if programador is None:
+        programador = ProgramadorIngesta()
+    programador.iniciar()
+    return programador
+
+
+def detener_programador():
+    if programador is not None:
+        programador.detener()
@@ -1,7 +1,20 @@
-def valoracion_intrinseca(piso):
+import hashlib
+
+# Rango común de salida (para evitar 0 o 100)
+SCORE_MIN, SCORE_MAX = 10, 95
+
+# --- Parámetros de mercado para Madrid ---
+UMBRALES = {
+    "rent": {"min": 700, "max": 2000},       # precio total mensual
+    "sale": {"min": 2500, "max": 7000},      # €/m²
+}
+
+
+def valoracion_intrinseca(piso, umbrales=None):
     """
     Calcula un score (10–95) basado en la relación entre precio y tamaño,
     adaptado al tipo de operación ('rent' o 'sale') y con umbrales para la Comunidad de Madrid.
+    `umbrales` ({"min", "max"}) sustituye a los fijos, p. ej. los de su zona (services/umbrales.py).
     """
 
     price = piso.get('price', 0)
@@ -11,17 +24,8 @@ def valoracion_intrinseca(piso):
     if price <= 0:
         return 10.0  # valor mínimo por defecto
 
-    # Rango común de salida (para evitar 0 o 100)
-    SCORE_MIN, SCORE_MAX = 10, 95
-
-    # --- Parámetros de mercado para Madrid ---
-    UMBRALES = {
-        "rent": {"min": 700, "max": 2000},       # precio total mensual
-        "sale": {"min": 2500, "max": 7000},      # €/m²
-    }
-
     # --- Selección de umbrales según tipo de operación ---
-    u = UMBRALES.get(operation, UMBRALES["rent"])
+    u = umbrales or UMBRALES.get(operation, UMBRALES["rent"])
 
     # --- Calcular score ---
     if operation == "rent":
@@ -44,7 +48,6 @@ def valoracion_intrinseca(piso):
 
 
 def generar_huella_digital(piso):
-    import hashlib
     elementos = [
         piso.get('address', '').lower().strip(),
         str(int(piso.get('price', 0))),
@@ -68,3 +71,46 @@ def es_duplicado(db, piso_data):
         return True
 
     return False
+
+
+def huellas_por_codigo(pisos):
+    """propertyCode -> huella para una página entera, reutilizando la huella ya calculada si viene."""
+    return {
+        p["propertyCode"]: p.get("huella_digital") or generar_huella_digital(p)
+        for p in pisos
+    }
+
+
+def detectar_duplicados(db, pisos):
+    """
+    Versión por lotes de es_duplicado para una página de anuncios.
+
+    Resuelve todas las huellas con una sola consulta IN sobre el índice de
+    huella_digital y devuelve propertyCode -> propertyCode original para los
+    anuncios que son copia de otro (ya guardado o anterior en la misma página).
+    Los que no son duplicados no aparecen en el resultado.
+    """
+    from models import Propiedad
+
+    huellas = huellas_por_codigo(pisos)
+    distintas = list(set(huellas.values()))
+
+    # huella -> código del anuncio original ya guardado
+    originales = {}
+    for i in range(0, len(distintas), 500):
+        filas = (
+            db.query(Propiedad.propertyCode, Propiedad.huella_digital, Propiedad.es_duplicado)
+            .filter(Propiedad.huella_digital.in_(distintas[i:i + 500]))
+            .order_by(Propiedad.es_duplicado, Propiedad.propertyCode)
+            .all()
+        )
+        for codigo, huella, _ in filas:
+            # El orden garantiza que gana un no-duplicado con el código más bajo
+            originales.setdefault(huella, codigo)
+
+    duplicados = {}
+    for codigo, huella in huellas.items():
+        original = originales.setdefault(huella, codigo)
+        if original != codigo:
+            duplicados[codigo] = original
+    return duplicados
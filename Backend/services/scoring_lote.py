@@ -0,0 +1,266 @@
+"""
+Scoring por lotes con NumPy: calcula score_intrinseco, score_zona,
+score_planta y score_final de muchos anuncios a la vez. puntuar_columnas no
+tiene bucles en Python por anuncio: los bucles que quedan son por valor
+distinto (zona, planta, umbral) tras agruparlos con np.unique. Lo usan la
+ingesta (update_all.guardar_elementos) y el recálculo de toda la tabla.
+
+- score_intrinseco: la misma fórmula que scoring.valoracion_intrinseca.
+- score_zona: lo barato que es el anuncio frente a los de su distrito
+  (percentil de precio, o de €/m² en venta, dentro de su zona y operación).
+- score_planta: a partir de `floor` ('bj', 'en', '3', '-1'...) y del ascensor.
+- score_final: media ponderada de los anteriores que se hayan podido calcular.
+"""
+import numpy as np
+
+from models import Propiedad
+from services.estadisticas import OPERATION_EXPR, ZONA_EXPR
+from services.scoring import SCORE_MAX, SCORE_MIN, UMBRALES
+
+PESOS = {"intrinseco": 0.5, "zona": 0.3, "planta": 0.2}
+
+# Plantas con nombre en Idealista
+PLANTAS_ESPECIALES = {"bj": 0.0, "en": 0.5, "ss": -0.5, "st": -1.0}
+
+
+def _columna(valores, dtype=float):
+    """Array de `dtype`; None -> NaN en float y False en bool."""
+    if not isinstance(valores, (list, tuple, np.ndarray)):
+        valores = list(valores)
+    return np.asarray(valores, dtype=dtype)
+
+
+def _texto(valores):
+    """Array de str; None -> ''."""
+    if not isinstance(valores, (list, tuple, np.ndarray)):
+        valores = list(valores)
+    arr = np.array(valores, dtype=object)
+    arr[arr == None] = ""  # noqa: E711  (comparación elemento a elemento)
+    return arr.astype(str)
+
+
+def _operaciones(valores):
+    """Operación en minúsculas (se pasa a minúsculas cada valor distinto, no cada anuncio)."""
+    distintas, inverso = np.unique(_texto(valores), return_inverse=True)
+    return np.char.lower(distintas)[inverso.reshape(-1)]
+
+
+def precio_base(operation, price, size):
+    """Precio total en alquiler y €/m² en el resto (NaN si no hay tamaño)."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        por_m2 = np.where(size > 0, price / size, np.nan)
+    return np.where(operation == "rent", price, por_m2)
+
+
+def score_intrinseco_lote(operation, price, size, u_min=None, u_max=None):
+    """
+    Versión vectorizada de valoracion_intrinseca (mismos umbrales y redondeo).
+    u_min/u_max permiten pasar umbrales por anuncio (modo "zona").
+    """
+    base = precio_base(operation, price, size)
+    if u_min is None or u_max is None:
+        es_venta = operation == "sale"
+        u_min = np.where(es_venta, UMBRALES["sale"]["min"], UMBRALES["rent"]["min"])
+        u_max = np.where(es_venta, UMBRALES["sale"]["max"], UMBRALES["rent"]["max"])
+
+    ratio = np.clip((u_max - base) / (u_max - u_min), 0.0, 1.0)
+    score = SCORE_MIN + (SCORE_MAX - SCORE_MIN) * ratio
+    score = np.where((price > 0) & ~np.isnan(base), score, SCORE_MIN)
+    return np.round(score, 2)
+
+
+def parsear_planta(floor):
+    """'bj' -> 0, 'en' -> 0.5, '3' -> 3, '-1' -> -1; None/desconocida -> NaN."""
+    texto = (floor or "").strip().lower()
+    if texto in PLANTAS_ESPECIALES:
+        return PLANTAS_ESPECIALES[texto]
+    try:
+        return float(int(texto))
+    except ValueError:
+        return np.nan
+
+
+def score_planta_lote(floor, has_lift):
+    """
+    Sótano 15, bajo 40, entreplanta 50, 1ª 60, 2ª-3ª 75. De la 4ª hacia
+    arriba 90 con ascensor; sin ascensor baja 15 puntos por planta.
+    """
+    # Hay pocas plantas distintas: se parsea cada una una vez
+    unicas, inverso = np.unique(_texto(floor), return_inverse=True)
+    planta = np.array([parsear_planta(f) for f in unicas], dtype=float)[inverso.reshape(-1)]
+
+    sin_ascensor = np.maximum(15.0, 75.0 - 15.0 * (planta - 3))
+    score = np.select(
+        [planta < 0, planta < 0.5, planta < 1, planta < 2, planta < 4, has_lift],
+        [15.0, 40.0, 50.0, 60.0, 75.0, 90.0],
+        default=sin_ascensor,
+    )
+    return np.where(np.isnan(planta), np.nan, score)
+
+
+def grupos_zona(operation, district):
+    """
+    Grupo (operation, zona) de cada anuncio como entero, y la clave
+    'operation|zona' de cada grupo. La zona es la de estadisticas.zona_de.
+    """
+    # np.unique por columna y zona_de sobre los distritos distintos, no sobre cada anuncio
+    ops, op_idx = np.unique(operation, return_inverse=True)
+    distritos, d_idx = np.unique(_texto(district), return_inverse=True)
+    zonas = np.char.strip(distritos)
+    zonas = np.where(zonas == "", "Desconocido", zonas)
+    zonas, z_de_distrito = np.unique(zonas, return_inverse=True)
+
+    combinado = op_idx.reshape(-1) * len(zonas) + z_de_distrito.reshape(-1)[d_idx.reshape(-1)]
+    presentes, grupo = np.unique(combinado, return_inverse=True)
+    claves = [f"{ops[k // len(zonas)]}|{zonas[k % len(zonas)]}" for k in presentes.tolist()]
+    return grupo.astype(np.intp).reshape(-1), claves
+
+
+def _tramos(grupo):
+    """Índices ordenados por grupo y (grupo, inicio, fin) de cada tramo."""
+    orden = np.argsort(grupo, kind="stable")
+    ordenado = grupo[orden]
+    cortes = np.flatnonzero(np.diff(ordenado)) + 1
+    inicios = np.concatenate(([0], cortes))
+    fines = np.concatenate((cortes, [len(ordenado)]))
+    return orden, [(ordenado[i], i, f) for i, f in zip(inicios, fines) if f > i]
+
+
+def _referencias(base, grupos):
+    """Precios base ordenados de cada grupo de `grupos` (sin los NaN)."""
+    grupo, claves = grupos
+    validos = ~np.isnan(base)
+    grupo, base = grupo[validos], base[validos]
+    orden, tramos = _tramos(grupo)
+    base = base[orden]
+    return {claves[g]: np.sort(base[i:f]) for g, i, f in tramos}
+
+
+def referencias_zona(operation, district, price, size):
+    """(operation|zona) -> precios base ordenados, para los percentiles de score_zona."""
+    operation = _operaciones(operation)
+    base = precio_base(operation, _columna(price), _columna(size))
+    return _referencias(base, grupos_zona(operation, district))
+
+
+def cargar_referencias(db, zonas=None, extra=()):
+    """
+    Referencias de score_zona desde la BD (solo de `zonas` si se indican),
+    más los anuncios de `extra` que todavía no estén guardados.
+    """
+    query = db.query(OPERATION_EXPR, ZONA_EXPR, Propiedad.price, Propiedad.size)
+    if zonas is not None:
+        query = query.filter(ZONA_EXPR.in_(list(zonas)))
+    filas = query.all() + [
+        (p["operation"], p.get("district"), p.get("price"), p.get("size")) for p in extra
+    ]
+    if not filas:
+        return {}
+    operation, district, price, size = zip(*filas)
+    return referencias_zona(operation, district, price, size)
+
+
+def score_zona_lote(base, grupos, referencias):
+    """Percentil medio del precio base dentro de su zona, invertido (más barato = más score)."""
+    grupo, claves = grupos
+    score = np.full(len(base), np.nan)
+    orden, tramos = _tramos(grupo)
+
+    for g, i, f in tramos:
+        ref = referencias.get(claves[g])
+        if ref is None or not len(ref):
+            continue
+        idx = orden[i:f]
+        valores = base[idx]
+        izq = np.searchsorted(ref, valores, side="left")
+        der = np.searchsorted(ref, valores, side="right")
+        percentil = (izq + der) / (2 * len(ref))
+        score[idx] = np.where(
+            np.isnan(valores), np.nan, SCORE_MIN + (SCORE_MAX - SCORE_MIN) * (1 - percentil)
+        )
+    return np.round(score, 2)
+
+
+def umbrales_por_anuncio(operation, city_slug, district_slug, umbrales):
+    """Arrays (u_min, u_max) de cada anuncio según una TablaUmbrales (services/umbrales.py)."""
+    ciudad = _texto(city_slug)
+    distrito = _texto(district_slug)
+    clave = np.char.add(np.char.add(np.char.add(np.char.add(operation, "|"), ciudad), "|"), distrito)
+    # Pocas zonas distintas: se resuelve cada una una vez
+    _, primero, inverso = np.unique(clave, return_index=True, return_inverse=True)
+    pares = np.array(
+        [umbrales.para(str(operation[i]), str(ciudad[i]), str(distrito[i])) for i in primero], dtype=float
+    ).reshape(-1, 2)
+    inverso = inverso.reshape(-1)
+    return pares[inverso, 0], pares[inverso, 1]
+
+
+def puntuar_columnas(
+    operation, district, price, size, floor, has_lift, referencias=None,
+    city_slug=None, district_slug=None, umbrales=None,
+):
+    """
+    Calcula los cuatro scores de columnas paralelas (listas o arrays).
+    Si no se pasan referencias, los percentiles de zona salen del propio lote.
+    Con `umbrales` (y los slugs de municipio y distrito) score_intrinseco usa
+    los umbrales de cada zona en vez de los fijos.
+    Devuelve un dict de arrays; NaN donde un score no se puede calcular.
+    """
+    operation = _operaciones(operation)
+    price = _columna(price)
+    size = _columna(size)
+    has_lift = _columna(has_lift, bool)
+    base = precio_base(operation, price, size)
+    grupos = grupos_zona(operation, district)
+
+    if referencias is None:
+        referencias = _referencias(base, grupos)
+
+    u_min = u_max = None
+    if umbrales is not None:
+        u_min, u_max = umbrales_por_anuncio(operation, city_slug, district_slug, umbrales)
+
+    intrinseco = score_intrinseco_lote(operation, price, size, u_min, u_max)
+    zona = score_zona_lote(base, grupos, referencias)
+    planta = score_planta_lote(floor, has_lift)
+
+    suma = PESOS["intrinseco"] * intrinseco
+    pesos = np.full(len(intrinseco), PESOS["intrinseco"])
+    for score, peso in ((zona, PESOS["zona"]), (planta, PESOS["planta"])):
+        validos = ~np.isnan(score)
+        suma = suma + np.where(validos, peso * np.nan_to_num(score), 0.0)
+        pesos = pesos + np.where(validos, peso, 0.0)
+
+    return {
+        "score_intrinseco": intrinseco,
+        "score_zona": zona,
+        "score_planta": planta,
+        "score_final": np.round(suma / pesos, 2),
+    }
+
+
+def _a_python(valor):
+    return None if np.isnan(valor) else float(valor)
+
+
+def puntuar_lote(pisos, referencias=None, umbrales=None):
+    """Rellena en cada dict de `pisos` los cuatro scores (None si no aplica)."""
+    pisos = list(pisos)
+    if not pisos:
+        return pisos
+    scores = puntuar_columnas(
+        [p.get("operation") or "rent" for p in pisos],
+        [p.get("district") for p in pisos],
+        [p.get("price") for p in pisos],
+        [p.get("size") for p in pisos],
+        [p.get("floor") for p in pisos],
+        [p.get("hasLift") for p in pisos],
+        referencias,
+        city_slug=[p.get("city_slug") for p in pisos],
+        district_slug=[p.get("district_slug") for p in pisos],
+        umbrales=umbrales,
+    )
+    for campo, valores in scores.items():
+        for p, v in zip(pisos, valores.tolist()):
+            p[campo] = _a_python(v)
+    return pisos
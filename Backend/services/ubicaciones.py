@@ -0,0 +1,87 @@
+from collections import Counter
+
+from sqlalchemy import func
+
+from models import Propiedad, Ubicacion
+from services.normalizacion import slug_ubicacion
+
+
+def clave_ubicacion(operation, city, district, neighborhood):
+    """
+    Clave (operation, city, district, neighborhood) tal y como se muestra en
+    el buscador. Devuelve None si la propiedad no tiene municipio.
+    """
+    city = (city or "").strip()
+    if not city or not operation:
+        return None
+    return (
+        operation,
+        city,
+        (district or "Desconocido").strip(),
+        (neighborhood or "").strip(),
+    )
+
+
+def registrar_cambio(deltas: Counter, antes, despues):
+    """Acumula en `deltas` el movimiento de un anuncio entre dos claves (o alta/baja si una es None)."""
+    if antes == despues:
+        return
+    if antes is not None:
+        deltas[antes] -= 1
+    if despues is not None:
+        deltas[despues] += 1
+
+
+def aplicar_deltas(db, deltas: Counter):
+    """Suma los contadores acumulados a la tabla ubicaciones (sin hacer commit)."""
+    for clave, delta in deltas.items():
+        if not delta:
+            continue
+        operation, city, district, neighborhood = clave
+        nodo = (
+            db.query(Ubicacion)
+            .filter(
+                Ubicacion.operation == operation,
+                Ubicacion.city == city,
+                Ubicacion.district == district,
+                Ubicacion.neighborhood == neighborhood,
+            )
+            .first()
+        )
+        if nodo is None:
+            nodo = Ubicacion(
+                operation=operation,
+                city=city,
+                district=district,
+                neighborhood=neighborhood,
+                city_slug=slug_ubicacion(city),
+                count=0,
+            )
+            db.add(nodo)
+        nodo.count = max((nodo.count or 0) + delta, 0)
+
+
+def reconstruir_ubicaciones(db):
+    """Recalcula la tabla entera con un GROUP BY sobre propiedades (sin hacer commit)."""
+    filas = (
+        db.query(
+            Propiedad.operation,
+            Propiedad.city,
+            Propiedad.district,
+            Propiedad.neighborhood,
+            func.count(Propiedad.propertyCode),
+        )
+        .filter(Propiedad.activo.isnot(False))
+        .group_by(Propiedad.operation, Propiedad.city, Propiedad.district, Propiedad.neighborhood)
+        .all()
+    )
+
+    deltas = Counter()
+    for operation, city, district, neighborhood, n in filas:
+        clave = clave_ubicacion(operation, city, district, neighborhood)
+        if clave is not None:
+            deltas[clave] += n
+
+    db.query(Ubicacion).delete()
+    db.flush()
+    aplicar_deltas(db, deltas)
@@ -0,0 +1,114 @@
+"""
+Umbrales de scoring por zona calculados de los propios datos.
+
+Los UMBRALES fijos de services/scoring.py son de Madrid capital, así que
+Alcorcón y el centro se puntúan con la misma escala. Aquí se calculan p10,
+p50 y p90 del precio (alquiler) o €/m² (venta) por municipio y distrito con
+un t-digest (una pasada, memoria acotada) y se guardan en umbrales_zona.
+
+En modo de scoring "zona" (SCORING_MODO=zona), el score de cada anuncio va
+de p10 (SCORE_MAX) a p90 (SCORE_MIN) de su distrito; si el distrito tiene
+pocos anuncios se usa el municipio y, si tampoco, los UMBRALES fijos.
+"""
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+from models import Propiedad, UmbralZona
+from services.cache import version_datos
+from services.cuantiles import TDigest
+from services.scoring import UMBRALES
+
+MODOS_SCORING = ("fijo", "zona")
+SCORING_MODO = os.getenv("SCORING_MODO", "fijo")
+
+# Mínimo de anuncios para fiarse de los cuantiles de una zona
+MIN_MUESTRAS = 20
+
+
+def _precio_base(operation, price, size):
+    if not price or price <= 0:
+        return None
+    if operation == "rent":
+        return price
+    return price / size if size and size > 0 else None
+
+
+def refrescar_umbrales(db, ciudades=None):
+    """
+    Recalcula umbrales_zona de las parejas (operation, city_slug) de
+    `ciudades` (o de todas si es None) en una sola pasada por propiedades.
+    No hace commit; igual que refrescar_estadisticas, va tras un flush.
+    """
+    query = db.query(
+        Propiedad.operation, Propiedad.city_slug, Propiedad.district_slug, Propiedad.price, Propiedad.size
+    )
+    borrado = db.query(UmbralZona)
+    if ciudades is not None:
+        ciudades = list(ciudades)
+        if not ciudades:
+            return
+        query = query.filter(tuple_(Propiedad.operation, Propiedad.city_slug).in_(ciudades))
+        borrado = borrado.filter(tuple_(UmbralZona.operation, UmbralZona.city_slug).in_(ciudades))
+
+    sketches = defaultdict(TDigest)
+    for operation, city, district, price, size in query.yield_per(5000):
+        base = _precio_base(operation, price, size)
+        if base is None:
+            continue
+        city, district = city or "", district or ""
+        sketches[(operation, city, district)].agregar(base)
+        if district:
+            sketches[(operation, city, "")].agregar(base)
+
+    borrado.delete(synchronize_session=False)
+    ahora = datetime.now()
+    for (operation, city, district), t in sketches.items():
+        db.add(
+            UmbralZona(
+                operation=operation,
+                city_slug=city,
+                district_slug=district,
+                n=t.n,
+                p10=t.cuantil(0.1),
+                p50=t.cuantil(0.5),
+                p90=t.cuantil(0.9),
+                actualizado_en=ahora,
+            )
+        )
+
+
+class TablaUmbrales:
+    """Umbrales (min, max) de cada anuncio con el escalonado distrito -> municipio -> fijos."""
+
+    def __init__(self, filas):
+        self.zonas = {
+            (f.operation, f.city_slug, f.district_slug): (f.p10, f.p90)
+            for f in filas
+            if f.n >= MIN_MUESTRAS and f.p10 is not None and f.p90 is not None and f.p90 > f.p10
+        }
+
+    def para(self, operation, city_slug, district_slug):
+        for clave in ((operation, city_slug, district_slug), (operation, city_slug, "")):
+            if clave in self.zonas:
+                return self.zonas[clave]
+        u = UMBRALES.get(operation, UMBRALES["rent"])
+        return u["min"], u["max"]
+
+
+_tabla = None
+_version = None
+_lock = threading.Lock()
+
+
+def obtener_umbrales(db):
+    """TablaUmbrales en memoria, recargada solo cuando cambia la versión de datos."""
+    global _tabla, _version
+    version = version_datos(db)
+    with _lock:
+        if _tabla is None or _version != version:
+            _tabla, _version = TablaUmbrales(db.query(UmbralZona).all()), version
+        return _tabla
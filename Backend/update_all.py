@@ -1,10 +1,46 @@
+from collections import Counter
 from datetime import datetime
+import argparse
+import asyncio
 import time
 
 from database import SessionLocal, init_db
 from models import Propiedad
-from services.idealista_api import IdealistaAPI
-from services.scoring import valoracion_intrinseca, generar_huella_digital
+from services.idealista_api import PAUSA_PAGINA, IdealistaAPI
+from services.idealista_async import IDEALISTA_BURST, IDEALISTA_RATE, IdealistaAsyncAPI
+from services.scoring import generar_huella_digital, detectar_duplicados
+from services.scoring_lote import cargar_referencias, puntuar_lote
+from services.normalizacion import slug_ubicacion
+from services.municipios import obtener_normalizador
+from services.ubicaciones import aplicar_deltas, clave_ubicacion, registrar_cambio
+from services.estadisticas import refrescar_estadisticas, zona_de
+from services.umbrales import SCORING_MODO, obtener_umbrales, refrescar_umbrales
+from services.planificador import IDEALISTA_CUOTA_DIARIA, planificar, registrar_busqueda
+from services.captura import capturador, capturas_disponibles, guardar_metadatos, leer_capturas
+from services.incremental import (
+    EJECUCIONES_PARA_INACTIVAR,
+    cerrar_ejecucion,
+    hash_contenido,
+    iniciar_ejecucion,
+    marcar_inactivas,
+    marcar_vistos,
+    registrar_areas,
+    registrar_cambios_precio,
+)
+from services.cache import incrementar_version_datos
+from services.heatmap_tiles import (
+    aplicar_deltas_heatmap,
+    nuevos_deltas_heatmap,
+    punto_heatmap,
+    registrar_cambio_heatmap,
+)
+from services.bulk_upsert import prefetch_existentes, upsert_propiedades
+from services.clusters import (
+    aplicar_deltas_cluster,
+    nuevos_deltas_cluster,
+    punto_cluster,
+    registrar_cambio_cluster,
+)
 
 
 
@@ -25,9 +61,34 @@ CENTROS = {
 }
 
 
-def seed_zona(db, api: IdealistaAPI, zona: str, operation: str):
-    """Replica la lógica de /seed-idealista pero sin FastAPI."""
-    center, distance_m = CENTROS.get(zona.lower(), ("40.4168,-3.7038", 8000))
+def centro_zona(zona: str):
+    return CENTROS.get(zona.lower(), ("40.4168,-3.7038", 8000))
+
+
+def area_busqueda(operation: str, center: str, distance_m):
+    """(operation, lat, lon, radio_km) del círculo de una búsqueda."""
+    lat, lon = (float(x) for x in center.split(","))
+    return operation, lat, lon, distance_m / 1000
+
+
+def area_zona(zona: str, operation: str):
+    """(operation, lat, lon, radio_km) del círculo que se busca para una zona."""
+    center, distance_m = centro_zona(zona)
+    return area_busqueda(operation, center, distance_m)
+
+
+def seed_zona(db, api: IdealistaAPI, zona: str, operation: str, incremental=False, ejecucion=None, captura=None):
+    """
+    Replica la lógica de /seed-idealista pero sin FastAPI.
+    Con `captura` (un directorio) guarda además cada página en crudo (services/captura.py).
+    """
+    center, distance_m = centro_zona(zona)
+    return seed_area(db, api, zona, center, distance_m, operation, incremental, ejecucion, captura)
+
+
+def seed_area(db, api: IdealistaAPI, zona: str, center: str, distance_m, operation: str,
+              incremental=False, ejecucion=None, captura=None, num_pages=3):
+    """Busca un círculo concreto y guarda el resultado con el nombre `zona`."""
     print(f"   → centro={center} distancia={distance_m}m (zona={zona}, op={operation})")
 
     # Idealista usa km en el parámetro distance (como en tu main.py)
@@ -35,64 +96,41 @@ def seed_zona(db, api: IdealistaAPI, zona: str, operation: str):
         center=center,
         distance=distance_m,
         operation=operation,
+        num_pages=num_pages,
+        al_recibir_pagina=capturador(captura, zona, operation),
     )
+    if isinstance(datos, dict) and "elementList" in datos:
+        guardar_metadatos(captura, zona, operation, center, distance_m, datos.get("completa"))
+
+    return guardar_elementos(db, datos, zona, operation, incremental, ejecucion)
 
+
+def guardar_elementos(db, datos, zona: str, operation: str, incremental=False, ejecucion=None):
+    """
+    Guarda en la BD la respuesta de Idealista de una zona/operación.
+    Con `incremental`, los anuncios cuyo hash de contenido no ha cambiado no
+    se reescriben (solo se marcan como vistos en `ejecucion`). Los que estaban
+    dados de baja se reescriben siempre: vuelven a las tablas derivadas.
+    """
     if not isinstance(datos, dict) or "elementList" not in datos:
         raise RuntimeError(f"Respuesta inesperada de Idealista en {zona} ({operation}): {datos}")
 
-    nuevas = 0
-    actualizadas = 0
+    # propertyCode -> payload; si un anuncio sale repetido en varias páginas gana el último
+    payloads = {}
+
+    elementos = datos.get("elementList", [])
+    # Municipio corregido de toda la página (config/municipios.json)
+    municipios = obtener_normalizador().normalizar_pagina(elementos)
 
-    for e in datos.get("elementList", []):
+    for e, city_val in zip(elementos, municipios):
         lat = e.get("latitude")
         lon = e.get("longitude")
         if lat is None or lon is None:
             continue
 
-        # --- Corrección del municipio (copiado de main.py) ---
-        city_val = e.get("municipality") or ""
         district_val = e.get("district") or ""
         neigh_val = e.get("neighborhood") or ""
 
-        if city_val.lower() == "madrid":
-            txt = f"{district_val} {neigh_val}".lower()
-            if "mostol" in txt:
-                city_val = "mostoles"
-            elif "alcorcon" in txt:
-                city_val = "alcorcon"
-            elif "fuenlabrad" in txt:
-                city_val = "fuenlabrada"
-            elif "getafe" in txt:
-                city_val = "getafe"
-            elif "leganes" in txt:
-                city_val = "leganes"
-            elif "pozuelo" in txt:
-                city_val = "pozuelo de alarcon"
-            elif "roz" in txt:
-                city_val = "las rozas de madrid"
-            elif "alcobend" in txt:
-                city_val = "alcobendas"
-            elif "parla" in txt:
-                city_val = "parla"
-            elif "coslada" in txt:
-                city_val = "coslada"
-            elif "torrejon" in txt:
-                city_val = "torrejon de ardoz"
-            elif "san sebastian" in txt:
-                city_val = "san sebastian de los reyes"
-            elif "alcala" in txt:
-                city_val = "alcala de henares"
-            elif "rivas" in txt:
-                city_val = "rivas vaciamadrid"
-            elif "majadahonda" in txt:
-                city_val = "majadahonda"
-            elif "boadilla" in txt:
-                city_val = "boadilla del monte"
-            elif "arroyomolinos" in txt:
-                city_val = "arroyomolinos"
-            elif "villaviciosa" in txt:
-                city_val = "villaviciosa de odon"
-
         # --- Mapeo Idealista → modelo Propiedad (igual que en main.py) ---
         payload = {
             "propertyCode": str(e.get("propertyCode", "")),
@@ -116,24 +154,117 @@ def seed_zona(db, api: IdealistaAPI, zona: str, operation: str):
         if not payload["propertyCode"]:
             continue
 
-        # Enriquecer con huella y score (como en main.py)
+        payload["city_slug"] = slug_ubicacion(city_val)
+        payload["district_slug"] = slug_ubicacion(district_val)
+        payload["neighborhood_slug"] = slug_ubicacion(neigh_val)
+
+        # Enriquecer con huella (los scores se calculan por lotes más abajo)
         payload["huella_digital"] = generar_huella_digital(payload)
-        payload["score_intrinseco"] = valoracion_intrinseca(payload)
+        payload["hash_contenido"] = hash_contenido(payload)
+        payload["activo"] = True
+        if ejecucion is not None:
+            payload["ultima_ejecucion"] = ejecucion
         payload["fecha_actualizacion"] = datetime.now()
         payload["fecha_obtencion"] = datetime.now()
 
-        existe = (
-            db.query(Propiedad)
-            .filter(Propiedad.propertyCode == payload["propertyCode"])
-            .first()
+        payloads[payload["propertyCode"]] = payload
+
+    # Estado previo de todos los anuncios de la página en una sola consulta (por lotes)
+    existentes = prefetch_existentes(
+        db,
+        payloads,
+        [
+            Propiedad.operation,
+            Propiedad.city,
+            Propiedad.district,
+            Propiedad.neighborhood,
+            Propiedad.latitude,
+            Propiedad.longitude,
+            Propiedad.price,
+            Propiedad.score_intrinseco,
+            Propiedad.hash_contenido,
+            Propiedad.activo,
+        ],
+    )
+
+    # Anuncios idénticos a lo guardado: en modo incremental no se reescriben
+    sin_cambios = [
+        codigo for codigo, p in payloads.items()
+        if codigo in existentes
+        and existentes[codigo].hash_contenido == p["hash_contenido"]
+        and existentes[codigo].activo is not False
+    ]
+    if incremental:
+        if ejecucion is not None:
+            marcar_vistos(db, sin_cambios, ejecucion)
+        for codigo in sin_cambios:
+            del payloads[codigo]
+            del existentes[codigo]
+    cambios_precio = registrar_cambios_precio(db, payloads, existentes)
+
+    # Duplicados por huella (contra la BD y dentro de la propia página) en una consulta
+    duplicados = detectar_duplicados(db, payloads.values())
+    for codigo, payload in payloads.items():
+        payload["es_duplicado"] = codigo in duplicados
+        payload["propiedad_original"] = duplicados.get(codigo)
+
+    # Los cuatro scores de toda la página de una vez; los percentiles de zona
+    # se comparan con lo guardado en sus distritos más los anuncios nuevos
+    referencias = cargar_referencias(
+        db,
+        {zona_de(p["district"]) for p in payloads.values()},
+        extra=[p for codigo, p in payloads.items() if codigo not in existentes],
+    )
+    umbrales = obtener_umbrales(db) if SCORING_MODO == "zona" else None
+    puntuar_lote(payloads.values(), referencias, umbrales)
+
+    # Cambios en los contadores de ubicaciones, la pirámide del heatmap y los clusters
+    deltas_ubicacion = Counter()
+    deltas_heatmap = nuevos_deltas_heatmap()
+    deltas_cluster = nuevos_deltas_cluster()
+    # Distritos cuyas estadísticas hay que recalcular al final
+    zonas_tocadas = set()
+    # (operation, city_slug) cuyos umbrales se recalculan al cerrar la ejecución
+    ciudades_tocadas = set()
+
+    for codigo, p in payloads.items():
+        e = existentes.get(codigo)
+        # Un anuncio dado de baja ya no cuenta en las tablas derivadas
+        if e is not None and e.activo is False:
+            e = None
+        registrar_cambio(
+            deltas_ubicacion,
+            clave_ubicacion(e.operation, e.city, e.district, e.neighborhood) if e else None,
+            clave_ubicacion(p["operation"], p["city"], p["district"], p["neighborhood"]),
+        )
+        registrar_cambio_heatmap(
+            deltas_heatmap,
+            punto_heatmap(e.operation, e.latitude, e.longitude, e.score_intrinseco) if e else None,
+            punto_heatmap(p["operation"], p["latitude"], p["longitude"], p["score_intrinseco"]),
+        )
+        registrar_cambio_cluster(
+            deltas_cluster,
+            punto_cluster(e.operation, e.latitude, e.longitude, e.price, e.score_intrinseco) if e else None,
+            punto_cluster(p["operation"], p["latitude"], p["longitude"], p["price"], p["score_intrinseco"]),
         )
+        if e:
+            zonas_tocadas.add(zona_de(e.district))
+            ciudades_tocadas.add((e.operation, slug_ubicacion(e.city)))
+        zonas_tocadas.add(zona_de(p["district"]))
+        ciudades_tocadas.add((p["operation"], p["city_slug"]))
 
-        db.merge(Propiedad(**payload))
-        if existe:
-            actualizadas += 1
-        else:
-            nuevas += 1
+    upsert_propiedades(db, list(payloads.values()))
+    actualizadas = len(existentes)
+    nuevas = len(payloads) - actualizadas
 
+    aplicar_deltas(db, deltas_ubicacion)
+    aplicar_deltas_heatmap(db, deltas_heatmap)
+    aplicar_deltas_cluster(db, deltas_cluster)
+    db.flush()
+    refrescar_estadisticas(db, zonas_tocadas)
+    # Invalida las respuestas cacheadas de la API (si algo se ha reescrito)
+    if payloads:
+        incrementar_version_datos(db)
     db.commit()
     total_guardadas = nuevas + actualizadas
 
@@ -143,14 +274,288 @@ def seed_zona(db, api: IdealistaAPI, zona: str, operation: str):
         "total_guardadas": total_guardadas,
         "nuevas": nuevas,
         "actualizadas": actualizadas,
+        "sin_cambios": len(sin_cambios) if incremental else 0,
+        "cambios_precio": cambios_precio,
+        "ciudades": ciudades_tocadas,
+        # Solo las búsquedas completas sirven para dar de baja lo que no aparece
+        "completa": bool(datos.get("completa")),
+        # Páginas que Idealista no devolvió: lo guardado es parcial
+        "errores_paginas": list(datos.get("errores_paginas") or []),
+        # Anuncios que Idealista dice tener en el área (no solo los de las páginas pedidas)
+        "total_idealista": datos.get("total") or len(elementos),
     }
 
 
-def main():
+def _resumen(zona, op, res):
+    texto = (
+        f"✅ {zona} ({op}): "
+        f"{res['total_guardadas']} guardadas | "
+        f"{res['nuevas']} nuevas | "
+        f"{res['actualizadas']} actualizadas"
+    )
+    if res["sin_cambios"]:
+        texto += f" | {res['sin_cambios']} sin cambios"
+    if res["cambios_precio"]:
+        texto += f" | {res['cambios_precio']} cambios de precio"
+    if res["errores_paginas"]:
+        texto += f" | ⚠️ {len(res['errores_paginas'])} páginas con error"
+    return texto
+
+
+def _anotar_errores(errores, zona, op, res):
+    """Añade a `errores` la búsqueda si alguna de sus páginas falló (aunque se guardase el resto)."""
+    if res["errores_paginas"]:
+        errores.append(f"{zona} ({op}): " + "; ".join(res["errores_paginas"]))
+
+
+def _iniciar_ejecucion(modo):
+    db = SessionLocal()
+    try:
+        return iniciar_ejecucion(db, modo)
+    finally:
+        db.close()
+
+
+def _retirar_de_derivadas(db, bajas):
+    """Quita de ubicaciones, heatmap, clusters y estadísticas los anuncios dados de baja (sin commit)."""
+    deltas_ubicacion = Counter()
+    deltas_heatmap = nuevos_deltas_heatmap()
+    deltas_cluster = nuevos_deltas_cluster()
+    for e in bajas:
+        registrar_cambio(deltas_ubicacion, clave_ubicacion(e.operation, e.city, e.district, e.neighborhood), None)
+        registrar_cambio_heatmap(
+            deltas_heatmap, punto_heatmap(e.operation, e.latitude, e.longitude, e.score_intrinseco), None
+        )
+        registrar_cambio_cluster(
+            deltas_cluster, punto_cluster(e.operation, e.latitude, e.longitude, e.price, e.score_intrinseco), None
+        )
+    aplicar_deltas(db, deltas_ubicacion)
+    aplicar_deltas_heatmap(db, deltas_heatmap)
+    aplicar_deltas_cluster(db, deltas_cluster)
+    db.flush()
+    refrescar_estadisticas(db, {zona_de(e.district) for e in bajas})
+
+
+def _cerrar_ejecucion(ejecucion, resultados, areas, llamadas, incremental, inactivar_tras, errores=()):
+    """
+    Recalcula los umbrales por zona de las ciudades tocadas (una vez por
+    ejecución y solo con SCORING_MODO=zona), guarda las áreas buscadas
+    enteras, da de baja los anuncios no vistos (modo incremental) y guarda
+    los totales de la ejecución junto con los errores de cada búsqueda.
+    Devuelve el texto de error guardado (None si no falló ninguna).
+    """
+    # Una línea por búsqueda (/ingesta/estado las separa por líneas)
+    error = "\n".join(" ".join(e.split()) for e in errores) or None
+    db = SessionLocal()
+    try:
+        ciudades = set().union(*(r["ciudades"] for r in resultados))
+        if SCORING_MODO == "zona" and ciudades:
+            refrescar_umbrales(db, ciudades)
+            # obtener_umbrales se cachea por versión de datos
+            incrementar_version_datos(db)
+        registrar_areas(db, ejecucion, areas)
+        db.flush()
+        inactivadas = 0
+        if incremental and not areas:
+            # Los círculos de ZONAS (10 y 5 km) tienen más páginas de las que
+            # se piden, así que solo las celdas de --planificar salen completas
+            print("⚠️ Ninguna búsqueda completa: no se da de baja ningún anuncio "
+                  "(las bajas necesitan búsquedas enteras, p. ej. con --planificar)")
+        if incremental:
+            bajas = marcar_inactivas(db, ejecucion, areas, inactivar_tras)
+            if bajas:
+                _retirar_de_derivadas(db, bajas)
+                incrementar_version_datos(db)
+            inactivadas = len(bajas)
+        cerrar_ejecucion(db, ejecucion, resultados, llamadas, inactivadas, error)
+        if inactivadas:
+            print(f"🗑️  {inactivadas} anuncios marcados como inactivos")
+        if errores:
+            print(f"⚠️ {len(errores)} búsquedas con errores")
+        return error
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _guardar_en_sesion(datos, zona: str, operation: str, incremental=False, ejecucion=None):
+    db = SessionLocal()
+    try:
+        return guardar_elementos(db, datos, zona, operation, incremental, ejecucion)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+async def main_async(rate=IDEALISTA_RATE, burst=IDEALISTA_BURST, incremental=False,
+                     inactivar_tras=EJECUCIONES_PARA_INACTIVAR, captura=None):
+    """
+    Igual que main() pero pidiendo todas las zonas, operaciones y páginas en
+    paralelo. El TokenBucket del cliente mantiene el ritmo dentro de la cuota,
+    así que no hacen falta las pausas fijas. Las escrituras en la BD siguen
+    siendo de una en una (en un hilo, para no bloquear las descargas).
+    """
+    init_db()
+    ejecucion = _iniciar_ejecucion("async-incremental" if incremental else "async")
+    resultados, areas, errores = [], [], []
+
+    trabajos = [(zona, op) for zona in ZONAS for op in OPERACIONES]
+    print(f"\n🚀 Actualización concurrente contra Idealista ({len(trabajos)} búsquedas, {rate} req/s)\n")
+    inicio = time.monotonic()
+
+    async with IdealistaAsyncAPI(rate=rate, burst=burst) as api:
+
+        async def descargar(zona, op):
+            center, distance_m = centro_zona(zona)
+            try:
+                datos = await api.search_by_area(
+                    center=center,
+                    distance=distance_m,
+                    operation=op,
+                    al_recibir_pagina=capturador(captura, zona, op),
+                )
+                if isinstance(datos, dict) and "elementList" in datos:
+                    guardar_metadatos(captura, zona, op, center, distance_m, datos.get("completa"))
+            except Exception as e:
+                datos = e
+            return zona, op, datos
+
+        for tarea in asyncio.as_completed([descargar(z, op) for z, op in trabajos]):
+            zona, op, datos = await tarea
+            if isinstance(datos, Exception):
+                print(f"❌ Error en {zona} ({op}): {datos}")
+                errores.append(f"{zona} ({op}): {datos}")
+                continue
+            try:
+                res = await asyncio.to_thread(_guardar_en_sesion, datos, zona, op, incremental, ejecucion)
+                resultados.append(res)
+                if res["completa"]:
+                    areas.append(area_zona(zona, op))
+                _anotar_errores(errores, zona, op, res)
+                print(_resumen(zona, op, res))
+            except Exception as e:
+                print(f"❌ Error en {zona} ({op}): {e}")
+                errores.append(f"{zona} ({op}): {e}")
+
+        llamadas = api.llamadas
+
+    error = _cerrar_ejecucion(ejecucion, resultados, areas, llamadas, incremental, inactivar_tras, errores)
+
+    print(f"\n🎯 Actualización completada en {time.monotonic() - inicio:.1f}s ({llamadas} llamadas).\n")
+    return error
+
+
+def main_replay(directorio, incremental=False, inactivar_tras=EJECUCIONES_PARA_INACTIVAR):
+    """
+    Ingesta desde páginas capturadas con --capturar, sin red ni pausas:
+    sirve para medir y ajustar guardar_elementos sin gastar cuota.
+    """
+    init_db()
+    trabajos = capturas_disponibles(directorio)
+    if not trabajos:
+        print(f"⚠️ No hay capturas en {directorio}")
+        return
+
+    ejecucion = _iniciar_ejecucion("replay-incremental" if incremental else "replay")
+    resultados, areas, errores = [], [], []
+    print(f"\n🔁 Reproduciendo {len(trabajos)} búsquedas capturadas en {directorio}\n")
+
+    inicio = time.perf_counter()
+    for zona, op in trabajos:
+        datos = leer_capturas(directorio, zona, op)
+        db = SessionLocal()
+        try:
+            res = guardar_elementos(db, datos, zona, op, incremental, ejecucion)
+            resultados.append(res)
+            # El círculo sale de los metadatos de la captura (las celdas del
+            # planificador no están en CENTROS)
+            if res["completa"]:
+                areas.append(area_busqueda(op, datos["center"], datos["distance"]))
+            print(_resumen(zona, op, res))
+        except Exception as e:
+            db.rollback()
+            print(f"❌ Error en {zona} ({op}): {e}")
+            errores.append(f"{zona} ({op}): {e}")
+        finally:
+            db.close()
+    duracion = time.perf_counter() - inicio
+
+    error = _cerrar_ejecucion(ejecucion, resultados, areas, 0, incremental, inactivar_tras, errores)
+    procesados = sum(r["total_guardadas"] + r["sin_cambios"] for r in resultados)
+    print(f"\n🎯 {procesados} anuncios en {duracion:.2f}s ({procesados / max(duracion, 1e-9):.0f} anuncios/s)\n")
+    return error
+
+
+def main_planificado(cuota=IDEALISTA_CUOTA_DIARIA, incremental=False,
+                     inactivar_tras=EJECUCIONES_PARA_INACTIVAR, captura=None, solo_plan=False):
+    """
+    Busca las celdas de la rejilla que más anuncios nuevos prometen por
+    llamada (services/planificador.py) en vez de las ZONAS fijas.
+    """
+    init_db()
+    db = SessionLocal()
+    try:
+        plan = planificar(db, OPERACIONES, cuota)
+    finally:
+        db.close()
+
+    llamadas_plan = sum(b["paginas"] for b in plan)
+    print(f"\n🗺️  Plan: {len(plan)} celdas, {llamadas_plan} llamadas de una cuota de {cuota}\n")
+    for b in plan:
+        print(f"   {b['operation']:4s} celda={b['celda']} centro={b['center']} "
+              f"páginas={b['paginas']} nuevos≈{b['nuevos_esperados']}")
+    if solo_plan or not plan:
+        return
+
+    api = IdealistaAPI()
+    ejecucion = _iniciar_ejecucion("planificada-incremental" if incremental else "planificada")
+    resultados, areas, errores = [], [], []
+
+    for b in plan:
+        zona = "celda_{}_{}".format(*b["celda"])
+        llamadas_antes = api.metricas["llamadas"]
+        db = SessionLocal()
+        try:
+            res = seed_area(db, api, zona, b["center"], b["distance"], b["operation"],
+                            incremental, ejecucion, captura, num_pages=b["paginas"])
+            # Una búsqueda con páginas fallidas no cuenta: la celda se vuelve a planificar
+            if not res["errores_paginas"]:
+                registrar_busqueda(
+                    db, b["operation"], b["celda"], api.metricas["llamadas"] - llamadas_antes,
+                    res["total_idealista"], res["nuevas"],
+                )
+            db.commit()
+            resultados.append(res)
+            if res["completa"]:
+                areas.append(area_busqueda(b["operation"], b["center"], b["distance"]))
+            _anotar_errores(errores, zona, b["operation"], res)
+            print(_resumen(zona, b["operation"], res))
+        except Exception as e:
+            db.rollback()
+            print(f"❌ Error en {zona} ({b['operation']}): {e}")
+            errores.append(f"{zona} ({b['operation']}): {e}")
+        finally:
+            db.close()
+        time.sleep(PAUSA_PAGINA)
+
+    error = _cerrar_ejecucion(ejecucion, resultados, areas, api.metricas["llamadas"], incremental,
+                              inactivar_tras, errores)
+    print("\n🎯 Actualización planificada completada.\n")
+    print(f"📈 Métricas Idealista: {api.resumen_metricas()}\n")
+    return error
+
+
+def main(incremental=False, inactivar_tras=EJECUCIONES_PARA_INACTIVAR, captura=None):
     # Asegurar tablas
     init_db()
 
     api = IdealistaAPI()
+    ejecucion = _iniciar_ejecucion("incremental" if incremental else "completa")
+    resultados, areas, errores = [], [], []
 
     total_calls = len(ZONAS) * len(OPERACIONES)
     print(f"\n🚀 Iniciando actualización directa contra Idealista ({total_calls} llamadas)\n")
@@ -160,24 +565,58 @@ def main():
             print(f"[{i}/{len(ZONAS)}] ⏳ Actualizando {zona.upper()} ({op})...")
             db = SessionLocal()
             try:
-                res = seed_zona(db, api, zona, op)
-                print(
-                    f"✅ {zona} ({op}): "
-                    f"{res['total_guardadas']} guardadas | "
-                    f"{res['nuevas']} nuevas | "
-                    f"{res['actualizadas']} actualizadas"
-                )
+                res = seed_zona(db, api, zona, op, incremental, ejecucion, captura)
+                resultados.append(res)
+                if res["completa"]:
+                    areas.append(area_zona(zona, op))
+                _anotar_errores(errores, zona, op, res)
+                print(_resumen(zona, op, res))
             except Exception as e:
                 db.rollback()
                 print(f"❌ Error en {zona} ({op}): {e}")
+                errores.append(f"{zona} ({op}): {e}")
             finally:
                 db.close()
 
             # Pausa para no ser agresivos con Idealista
             time.sleep(5)
 
+    error = _cerrar_ejecucion(ejecucion, resultados, areas, api.metricas["llamadas"], incremental,
+                              inactivar_tras, errores)
     print("\n🎯 Actualización completada.\n")
+    print(f"📈 Métricas Idealista: {api.resumen_metricas()}\n")
+    return error
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Actualiza la BD desde Idealista")
+    parser.add_argument("--async", dest="modo_async", action="store_true",
+                        help="Descargas concurrentes con limitador de cuota")
+    parser.add_argument("--rate", type=float, default=IDEALISTA_RATE, help="Peticiones por segundo (modo async)")
+    parser.add_argument("--burst", type=int, default=IDEALISTA_BURST, help="Ráfaga máxima (modo async)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="No reescribe anuncios sin cambios y da de baja los que dejan de aparecer "
+                             "(solo en búsquedas completas: con ZONAS no lo son, usa --planificar)")
+    parser.add_argument("--inactivar-tras", type=int, default=EJECUCIONES_PARA_INACTIVAR,
+                        help="Ejecuciones sin aparecer para marcar un anuncio como inactivo")
+    parser.add_argument("--capturar", metavar="DIR",
+                        help="Guarda cada página de Idealista en DIR (.jsonl.gz)")
+    parser.add_argument("--replay", metavar="DIR",
+                        help="Ingesta desde las páginas capturadas en DIR, sin llamar a Idealista")
+    parser.add_argument("--planificar", action="store_true",
+                        help="Busca las celdas de la rejilla con más anuncios nuevos esperados por llamada")
+    parser.add_argument("--cuota", type=int, default=IDEALISTA_CUOTA_DIARIA,
+                        help="Llamadas disponibles para el plan (modo --planificar)")
+    parser.add_argument("--solo-plan", action="store_true", help="Muestra el plan sin llamar a Idealista")
+    args = parser.parse_args()
+
+    if args.planificar or args.solo_plan:
+        main_planificado(cuota=args.cuota, incremental=args.incremental, inactivar_tras=args.inactivar_tras,
+                         captura=args.capturar, solo_plan=args.solo_plan)
+    elif args.replay:
+        main_replay(args.replay, incremental=args.incremental, inactivar_tras=args.inactivar_tras)
+    elif args.modo_async:
+        asyncio.run(main_async(rate=args.rate, burst=args.burst, incremental=args.incremental,
+                               inactivar_tras=args.inactivar_tras, captura=args.capturar))
+    else:
+        main(incremental=args.incremental, inactivar_tras=args.inactivar_tras, captura=args.capturar)
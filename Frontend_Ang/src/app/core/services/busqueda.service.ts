@@ -23,7 +23,6 @@ export class BusquedaService {
 
   buscarTodasPaginas(paramsBase: any): Promise<Propiedad[]> {
     const per_page = 100;
-    let page = 1;
     let acumulado: Propiedad[] = [];
 
     // ✅ Sanitizar: quitar undefined, null, '', y también false en booleanos (p.ej. hasLift)
@@ -45,14 +44,17 @@ export class BusquedaService {
 
     return new Promise(async (resolve, reject) => {
       try {
+        // Paginación por cursor: cada página cuesta lo mismo en el backend
+        let cursor: string | null = null;
         while (true) {
-          const params = buildParams({ page, per_page });
+          const params = buildParams(
+            cursor ? { per_page, cursor } : { per_page, paginacion: 'cursor' }
+          );
           const res: any = await lastValueFrom(this.http.get(`${this.baseUrl}/buscar`, { params }));
           const chunk = Array.isArray(res?.propiedades) ? res.propiedades : [];
           acumulado = acumulado.concat(chunk);
-          const total = res?.total ?? chunk.length;
-          if (page * per_page >= total || chunk.length === 0) break;
-          page++;
+          cursor = res?.next_cursor ?? null;
+          if (!cursor || chunk.length === 0) break;
         }
         resolve(acumulado);
       } catch (e) {
@@ -63,7 +65,7 @@ export class BusquedaService {
 
   async buscarTodo(operation: 'rent' | 'sale'): Promise<Propiedad[]> {
     const per_page = 500;
-    let page = 1;
+    let cursor: string | null = null;
     let acumulado: Propiedad[] = [];
 
     return new Promise(async (resolve, reject) => {
@@ -72,8 +74,8 @@ export class BusquedaService {
           const params = new HttpParams({
             fromObject: {
               ...(operation ? { operation } : {}),
-              page,
               per_page,
+              ...(cursor ? { cursor } : { paginacion: 'cursor' }),
             } as any,
           });
 
@@ -84,9 +86,8 @@ export class BusquedaService {
           const chunk = Array.isArray(res?.propiedades) ? res.propiedades : [];
           acumulado = acumulado.concat(chunk);
 
-          const total = res?.total ?? chunk.length;
-          if (page * per_page >= total || chunk.length === 0) break;
-          page++;
+          cursor = res?.next_cursor ?? null;
+          if (!cursor || chunk.length === 0) break;
         }
         resolve(acumulado);
       } catch (e) {